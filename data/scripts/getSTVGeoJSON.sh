@@ -27,50 +27,46 @@ fi
 trap "rm -f ${LOCK}; exit" INT TERM EXIT
 echo $$ > ${LOCK}
 
-psql="psql -d \"host=db user=${POSTGRES_USER} password=${POSTGRES_PASSWORD}\" -t -c"
+psql="psql -d \"host=db user=${POSTGRES_USER} password=${POSTGRES_PASSWORD}\" -A -t -c"
 
 DIR="$( cd "$( dirname "$0" )" && pwd )"
 DATA="/data"
 mkdir -p $DATA
 LAYER='stv'
 FCFILE="${DATA}/${LAYER}.json"
+TMPFILE="${FCFILE}.tmp"
 
-
-function feature() {
-  local target="$1"
-  query="
-    SELECT jsonb_build_object(
-      'type',       'Feature',
-      'id',         id,
-      'geometry',   ST_AsGeoJSON(territory)::json,
-      'properties', to_jsonb(row) - 'territory'
-    ) FROM (
-      SELECT * FROM view_stvmap WHERE id = $target
-    ) row;
-  "
-}
-
-
-SEPARATOR=""
+# ash-compatible array join implementation
+IDS=""
+DELIM=""
+for id in $@ ; do
+  IDS="${IDS}${DELIM}${id}"
+  DELIM=","
+done
 
 if [[ "$#" -eq 0 ]]; then
-  LIST=$(eval $psql "'select id from api_spacetimevolume'")
+  WHERE="TRUE"
 else
-  LIST=$@
+  WHERE="id = ANY('{${IDS}}'::int[])"
 fi
 
-# build geojson for STVs
-echo '{"type": "FeatureCollection","features": [' >| $FCFILE
-for id in $LIST; do
-  feature "$id"
-  res=$(eval $psql "\"$query\"")
-  if [ "$res" != "" ]; then
-    echo -n $SEPARATOR >> $FCFILE
-    echo $res >> $FCFILE
-    SEPARATOR=","
-  fi
-done
-echo ']}' >> $FCFILE
+# build newline-delimited geojson for STVs in a single query,
+# same output as `./manage.py export_stvs`
+query="
+  SELECT jsonb_build_object(
+    'type',       'Feature',
+    'id',         id,
+    'geometry',   ST_AsGeoJSON(territory)::json,
+    'properties', to_jsonb(stv) - 'territory'
+  ) FROM view_stvmap AS stv WHERE ${WHERE} ORDER BY id;
+"
+
+if ! eval $psql "\"$query\"" >| $TMPFILE; then
+  echo "$(date): Failed to build GeoJSON"
+  rm -f $TMPFILE
+  exit 1
+fi
+mv -f $TMPFILE $FCFILE
 echo "$(date): GeoJSON built successfully"
 
 sh ${DIR}/buildMVT.sh $@
@@ -0,0 +1,104 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.db import connection
+
+# One GeoJSON Feature per row, properties are the same as in STV tiles
+STV_FEATURE_QUERY = """
+    SELECT json_build_object(
+        'type', 'Feature',
+        'id', id,
+        'geometry', ST_AsGeoJSON(territory)::json,
+        'properties', to_jsonb(stv) - 'territory'
+    )::text
+    FROM view_stvmap AS stv
+    WHERE {}
+    ORDER BY id
+"""
+
+# STVs with history records since timestamp, including color or admin_level changes
+# of their entity, same selection as data/scripts/selectUpdatedSTVs.sh
+STV_UPDATED_SINCE = """
+    id IN (
+        SELECT id FROM api_historicalspacetimevolume
+        WHERE history_date >= to_timestamp(%(since)s)
+        UNION
+        SELECT api_spacetimevolume.id
+        FROM api_spacetimevolume
+        JOIN api_historicalterritorialentity history
+            ON history.id = api_spacetimevolume.entity_id
+        JOIN api_territorialentity entity
+            ON entity.id = api_spacetimevolume.entity_id
+        WHERE history.history_date >= to_timestamp(%(since)s)
+        AND NOT (
+            history.color_id = entity.color_id
+            AND history.admin_level = entity.admin_level
+        )
+    )
+"""
+
+# Rows fetched from the server-side cursor at once, territories can be huge
+CHUNK_SIZE = 50
+
+
+def stv_export_filters(
+    ids=None, entities=None, start_date=None, end_date=None, bbox=None, since=None
+):  # pylint: disable=R0913
+    """Conditions and parameters for STV_FEATURE_QUERY"""
+    where = []
+    params = {}
+    if ids:
+        where.append("id = ANY(%(ids)s)")
+        params["ids"] = ids
+    if entities:
+        where.append("entity_id = ANY(%(entities)s)")
+        params["entities"] = entities
+    if start_date is not None:
+        where.append("end_date >= %(start_date)s")
+        params["start_date"] = start_date
+    if end_date is not None:
+        where.append("start_date <= %(end_date)s")
+        params["end_date"] = end_date
+    if bbox is not None:
+        where.append(
+            "ST_Intersects(territory, ST_MakeEnvelope("
+            "%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 4326))"
+        )
+        params.update(zip(("xmin", "ymin", "xmax", "ymax"), bbox))
+    if since is not None:
+        where.append(STV_UPDATED_SINCE)
+        params["since"] = since
+    return where, params
+
+
+def stv_features(where, params):
+    """
+    Yield GeoJSON Features as text straight from PostGIS
+    Rows are read through a server-side cursor, only one chunk is kept in memory
+    """
+    with connection.chunked_cursor() as cursor:
+        cursor.cursor.itersize = CHUNK_SIZE
+        cursor.execute(
+            STV_FEATURE_QUERY.format(" AND ".join(where) or "TRUE"),  # nosec
+            params,
+        )
+        for (feature,) in cursor:
+            yield feature
@@ -19,12 +19,30 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from django.contrib.gis.db.models.functions import GeomOutputGeoFunc
 from django.contrib.gis.geos import GEOSGeometry
 from django.db import connection
 
 AREA_TOLERANCE = 20.0
 
 
+class SimplifyPreserveTopology(GeomOutputGeoFunc):
+    """
+    ST_SimplifyPreserveTopology(geometry, tolerance) for querysets
+    """
+
+    function = "ST_SimplifyPreserveTopology"
+    arity = 2
+
+
+def ewkb(geom):
+    """
+    Geometry as binary EWKB query parameter,
+    smaller and faster to build and parse than EWKT
+    """
+    return bytes(geom.ewkb)
+
+
 def find_difference(geom_a, geom_b):
     """
     Calculate difference between two polygons
@@ -36,13 +54,17 @@ def find_difference(geom_a, geom_b):
             SELECT ST_Union(geom) as geom FROM (
                 SELECT (ST_Dump(ST_Difference(p1, p2))).geom FROM (
                     SELECT
-                        ST_MakeValid(%(geom_a)s::geometry) as p1,
-                        ST_MakeValid(%(geom_b)s::geometry) as p2
+                        ST_MakeValid(ST_GeomFromEWKB(%(geom_a)s)) as p1,
+                        ST_MakeValid(ST_GeomFromEWKB(%(geom_b)s)) as p2
                     ) as foo
                 ) as foo
                 WHERE ST_Dimension(geom) = 2 AND ST_Area(geom::geography) > %(tolerance)s
             """,
-            {"geom_a": geom_a.ewkt, "geom_b": geom_b.ewkt, "tolerance": AREA_TOLERANCE},
+            {
+                "geom_a": ewkb(geom_a),
+                "geom_b": ewkb(geom_b),
+                "tolerance": AREA_TOLERANCE,
+            },
         )
         row = cursor.fetchone()[0]
     return row
@@ -64,7 +86,8 @@ def calculate_area(geom):
     """
     with connection.cursor() as cursor:
         cursor.execute(
-            "SELECT ST_Area(%(geom)s::geography) AS area", {"geom": geom.ewkt}
+            "SELECT ST_Area(ST_GeomFromEWKB(%(geom)s)::geography) AS area",
+            {"geom": ewkb(geom)},
         )
         row = cursor.fetchone()[0]
     return row
@@ -0,0 +1,98 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+
+from django.db import connection
+
+# Points given by coordinates, keyed by position in the request
+POINTS_FROM_COORDINATES = """
+    SELECT ordinality - 1 AS key, ST_SetSRID(ST_MakePoint(lon, lat), 4326) AS geom, date
+    FROM unnest(%(lons)s::float8[], %(lats)s::float8[], %(dates)s::numeric[])
+        WITH ORDINALITY AS points(lon, lat, date)
+"""
+
+# Points of CachedData events, keyed by event id
+POINTS_FROM_CACHED_DATA = """
+    SELECT id AS key, location AS geom, date
+    FROM api_cacheddata
+    WHERE id = ANY(%(ids)s) AND location IS NOT NULL
+"""
+
+STVS_AT_POINTS = """
+    WITH points AS ({})
+    SELECT key, json_agg(json_build_object(
+        'stv', stv.id,
+        'start_date', stv.start_date,
+        'end_date', stv.end_date,
+        'entity', stv.entity_id,
+        'label', entity.label,
+        'admin_level', entity.admin_level,
+        'parents', (
+            SELECT COALESCE(json_agg(json_build_object(
+                'entity', parent.id,
+                'label', parent.label,
+                'admin_level', parent.admin_level,
+                'control_type', relation.control_type
+            ) ORDER BY parent.admin_level), '[]'::json)
+            FROM api_politicalrelation relation
+            JOIN api_territorialentity parent ON parent.id = relation.parent_id
+            WHERE relation.child_id = stv.entity_id
+            AND relation.during @> points.date
+        )
+    ) ORDER BY entity.admin_level, stv.id)::text
+    FROM points
+    JOIN api_spacetimevolume stv
+        ON ST_Intersects(stv.territory, points.geom)
+        AND stv.during @> points.date
+    JOIN api_territorialentity entity ON entity.id = stv.entity_id
+    GROUP BY key
+"""
+
+
+def _stvs_at(points, params):
+    with connection.cursor() as cursor:
+        cursor.execute(STVS_AT_POINTS.format(points), params)  # nosec
+        return {key: json.loads(stvs) for key, stvs in cursor.fetchall()}
+
+
+def stvs_at_points(points):
+    """
+    STVs covering each of (lon, lat, date) points with parents of their entities
+    at that date, in a single query. Lists are ordered by admin level.
+    """
+    found = _stvs_at(
+        POINTS_FROM_COORDINATES,
+        {
+            "lons": [point[0] for point in points],
+            "lats": [point[1] for point in points],
+            "dates": [point[2] for point in points],
+        },
+    )
+    return [found.get(key, []) for key in range(len(points))]
+
+
+def stvs_at_cached_data(ids):
+    """
+    STVs covering location of CachedData events at their dates, by event id
+    """
+    found = _stvs_at(POINTS_FROM_CACHED_DATA, {"ids": ids})
+    return {key: found.get(key, []) for key in ids}
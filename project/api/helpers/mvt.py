@@ -0,0 +1,233 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+
+# Tile coordinates are either query parameters or columns of an outer query
+MVT_STV_QUERY = """
+    SELECT
+        id, start_date, end_date, "references", entity_id, wikidata_id, color, admin_level
+        , ST_AsMVTGeom(
+            ST_SnapToGrid(ST_Transform(ST_Simplify(territory, %(simplification)s), 3857), 1)
+            , TileBBox(%(zoom)s, {x_coor}, {y_coor})) as territory
+    FROM view_stvmap
+    WHERE ST_Intersects(territory, TileBBox(%(zoom)s, {x_coor}, {y_coor}, 4326))
+"""
+
+# Territory is already simplified and transformed, see update_simplified_territory
+# Topology-preserving geometry of the era bucket is preferred when it exists,
+# see update_topology_territory
+MVT_STV_SIMPLIFIED_QUERY = """
+    SELECT
+        id, start_date, end_date, "references", entity_id, wikidata_id, color, admin_level
+        , ST_AsMVTGeom(
+            COALESCE(topology, simplified), TileBBox(%(zoom)s, {x_coor}, {y_coor})
+        ) as territory
+    FROM view_stvmap
+    JOIN (
+        SELECT stv_id, territory AS simplified
+        FROM api_simplifiedterritory WHERE zoom = %(zoom)s AND bucket IS NULL
+    ) AS simplified ON simplified.stv_id = view_stvmap.id
+    LEFT JOIN (
+        SELECT stv_id, territory AS topology
+        FROM api_simplifiedterritory WHERE zoom = %(zoom)s AND bucket = %(bucket)s
+    ) AS topology ON topology.stv_id = view_stvmap.id
+    WHERE ST_Intersects(simplified, TileBBox(%(zoom)s, {x_coor}, {y_coor}))
+"""
+
+# Keep STVs which exist at least one day within [date_start, date_end]
+MVT_STV_DATE_FILTER = "start_date <= %(date_end)s AND end_date >= %(date_start)s"
+
+
+def mvt_geom_simplification(zoom):
+    """Simplification for territory field"""
+    # For WebMercator (3857) X coordinate bounds are ±20037508.3427892 meters
+    # For SRID 4326 X coordinated bounds are ±180 degrees
+    # resolution = (xmax - xmin) or (xmax * 2)
+    # It is 5-10 times faster work with SRID 4326,
+    # We will apply ST_Simplify before ST_Transform
+    resolution = 360
+    # https://postgis.net/docs/ST_AsMVT.html
+    # tile extent in screen space as defined by the specification
+    extent = 4096
+
+    # Find safe tolerance for ST_Simplfy
+    tolerance = (float(resolution) / 2**zoom) / float(extent)
+    # Apply additional simplification for distant zoom levels
+    tolerance_multiplier = 1 if zoom > 5 else 2.2 - 0.2 * zoom
+    simplification = tolerance * tolerance_multiplier
+    return simplification
+
+
+def stv_mvt_geom_query(zoom, where=(), x_coor="%(x_coor)s", y_coor="%(y_coor)s"):
+    """
+    STV tile query narrowed down with additional conditions
+    Precomputed geometry is used for zoom levels present in SimplifiedTerritory
+    """
+    template = MVT_STV_QUERY
+    if zoom <= settings.MVT_SIMPLIFIED_ZOOM:
+        template = MVT_STV_SIMPLIFIED_QUERY
+    query = template.format(x_coor=x_coor, y_coor=y_coor)
+    for condition in where:
+        query += " AND ({})".format(condition)
+    return query
+
+
+def stv_mvt_params(zoom, x_coor=None, y_coor=None, **kwargs):
+    """Parameters for stv_mvt_geom_query"""
+    return {
+        "zoom": zoom,
+        "x_coor": x_coor,
+        "y_coor": y_coor,
+        "simplification": mvt_geom_simplification(zoom),
+        "bucket": None,
+        **kwargs,
+    }
+
+
+def stv_mvt_layer(bucket=None):
+    """
+    Layer name, condition and parameters for pregenerated STV tiles
+    None stands for the layer with all eras
+    """
+    if bucket is None:
+        return "stv", [], {}
+    date_start, date_end = date_bucket_range(bucket)
+    return (
+        date_bucket_layer(bucket),
+        [MVT_STV_DATE_FILTER],
+        {"date_start": date_start, "date_end": date_end, "bucket": bucket},
+    )
+
+
+def date_bucket(date):
+    """Era bucket which contains provided JDN"""
+    return int(date // settings.MVT_STV_DATE_BUCKET)
+
+
+def date_bucket_range(bucket):
+    """First and last JDN of the era bucket"""
+    size = settings.MVT_STV_DATE_BUCKET
+    return bucket * size, (bucket + 1) * size - 1
+
+
+def date_bucket_layer(bucket):
+    """Name of the pregenerated MVTLayers layer for the era bucket"""
+    return "stv:{}".format(bucket)
+
+
+def update_simplified_territory(ids=None):
+    """
+    Rebuild SimplifiedTerritory for STVs, all of them if ids are not provided
+    Collapsed geometries are not stored
+    """
+    zooms = list(range(0, settings.MVT_SIMPLIFIED_ZOOM + 1))
+    params = {
+        "ids": ids,
+        "zooms": zooms,
+        "tolerances": [mvt_geom_simplification(zoom) for zoom in zooms],
+    }
+    condition = "TRUE" if ids is None else "id = ANY(%(ids)s)"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            DELETE FROM api_simplifiedterritory
+            WHERE stv_id IN (SELECT id FROM api_spacetimevolume WHERE {})
+            """.format(  # nosec
+                condition
+            ),
+            params,
+        )
+        cursor.execute(
+            """
+            INSERT INTO api_simplifiedterritory (stv_id, zoom, territory)
+            SELECT stv_id, zoom, territory FROM (
+                SELECT
+                    id AS stv_id, zoom
+                    , ST_SnapToGrid(
+                        ST_Transform(ST_Simplify(territory, tolerance), 3857), 1
+                    ) AS territory
+                FROM api_spacetimevolume
+                CROSS JOIN unnest(%(zooms)s::integer[], %(tolerances)s::float8[])
+                    AS zooms(zoom, tolerance)
+                WHERE {}
+            ) AS simplified
+            WHERE territory IS NOT NULL AND NOT ST_IsEmpty(territory)
+            """.format(  # nosec
+                condition
+            ),
+            params,
+        )
+
+
+def update_topology_territory(bucket):
+    """
+    Simplify STVs of the era bucket without gaps and slivers along shared borders.
+    Borders of all STVs in the bucket are noded into edges, every edge is
+    simplified once without collapsing rings, simplified edges are noded again
+    where they cross, and the faces are assigned back to the STVs they lie in.
+    Replaces topology rows of the bucket in SimplifiedTerritory.
+    """
+    date_start, date_end = date_bucket_range(bucket)
+    params = {"bucket": bucket, "date_start": date_start, "date_end": date_end}
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM api_simplifiedterritory WHERE bucket = %(bucket)s", params
+        )
+        cursor.execute(
+            """
+            CREATE TEMPORARY TABLE topology_edges ON COMMIT DROP AS
+            SELECT (ST_Dump(ST_LineMerge(ST_UnaryUnion(
+                ST_Collect(ST_Boundary(territory))
+            )))).geom AS edge
+            FROM api_spacetimevolume
+            WHERE during && numrange(%(date_start)s, %(date_end)s, '[]')
+            """,
+            params,
+        )
+        for zoom in range(0, settings.MVT_SIMPLIFIED_ZOOM + 1):
+            cursor.execute(
+                """
+                WITH noded AS (
+                    SELECT ST_UnaryUnion(ST_Collect(
+                        ST_SimplifyPreserveTopology(edge, %(tolerance)s)
+                    )) AS edges
+                    FROM topology_edges
+                ), faces AS (
+                    SELECT (ST_Dump(ST_Polygonize(edges))).geom AS face FROM noded
+                )
+                INSERT INTO api_simplifiedterritory (stv_id, zoom, bucket, territory)
+                SELECT
+                    id, %(zoom)s, %(bucket)s
+                    , ST_SnapToGrid(ST_Transform(ST_Union(face), 3857), 1)
+                FROM faces
+                JOIN api_spacetimevolume
+                ON ST_Intersects(territory, ST_PointOnSurface(face))
+                WHERE during && numrange(%(date_start)s, %(date_end)s, '[]')
+                GROUP BY id
+                """,
+                {
+                    **params,
+                    "zoom": zoom,
+                    "tolerance": mvt_geom_simplification(zoom),
+                },
+            )
@@ -19,10 +19,83 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from cacheops import invalidate_model
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry
 from django.core.exceptions import ValidationError
+from django.db import connection, transaction
 from api.models import SpacetimeVolume
 
-from .geometry import geom_difference, calculate_area, AREA_TOLERANCE
+from .geometry import ewkb, AREA_TOLERANCE
+from .mvt import update_simplified_territory
+from .te_list import update_te_list_fragments
+from .tile_versions import bump_tile_versions
+
+# Parts of a difference smaller than AREA_TOLERANCE are dropped as slivers,
+# same as geometry.find_difference does.
+# New geometry is clipped by kept STVs first, modified STVs are clipped
+# by the result unless it's too small; they are updated with history
+# when something is left of them, otherwise returned for deletion.
+# History is stamped with clock_timestamp(), now() would be the start of the
+# add_new_stv transaction.
+SUBTRACT_GEOMETRY = """
+    WITH new AS (
+        SELECT ST_GeomFromEWKB(%(geom)s) AS geom
+    ), kept AS (
+        SELECT ST_Union(ST_MakeValid(territory)) AS geom
+        FROM api_spacetimevolume WHERE id = ANY(%(keep)s)
+    ), clipped AS (
+        SELECT CASE WHEN kept.geom IS NULL THEN new.geom ELSE (
+            SELECT ST_Union(part) FROM (
+                SELECT (ST_Dump(ST_Difference(ST_MakeValid(new.geom), kept.geom))).geom
+                AS part
+            ) AS parts
+            WHERE ST_Dimension(part) = 2 AND ST_Area(part::geography) > %(tolerance)s
+        ) END AS geom
+        FROM new, kept
+    ), accepted AS (
+        SELECT geom FROM clipped
+        WHERE ST_Area(geom::geography) >= %(tolerance)s
+    ), modified AS (
+        SELECT stv.id, (
+            SELECT ST_Union(part) FROM (
+                SELECT (
+                    ST_Dump(ST_Difference(ST_MakeValid(stv.territory), accepted.geom))
+                ).geom AS part
+            ) AS parts
+            WHERE ST_Dimension(part) = 2 AND ST_Area(part::geography) > %(tolerance)s
+        ) AS territory
+        FROM api_spacetimevolume AS stv, accepted
+        WHERE stv.id = ANY(%(modify)s)
+    ), updated AS (
+        UPDATE api_spacetimevolume AS stv SET territory = modified.territory
+        FROM modified
+        WHERE stv.id = modified.id
+        AND ST_Area(modified.territory::geography) >= %(tolerance)s
+        RETURNING stv.*
+    ), history AS (
+        INSERT INTO api_historicalspacetimevolume (
+            id, start_date, end_date, territory, entity_id, "references",
+            visual_center, during, history_date, history_type
+        )
+        SELECT
+            id, start_date, end_date, territory, entity_id, "references",
+            visual_center, during, clock_timestamp(), '~'
+        FROM updated
+    )
+    SELECT
+        clipped.geom,
+        ST_Area(clipped.geom::geography),
+        ARRAY(SELECT id FROM updated ORDER BY id),
+        ARRAY(SELECT DISTINCT entity_id FROM updated ORDER BY entity_id),
+        ARRAY(
+            SELECT id FROM modified
+            WHERE territory IS NULL
+            OR ST_Area(territory::geography) < %(tolerance)s
+            ORDER BY id
+        )
+    FROM clipped
+"""
 
 
 def overlaps_queryset(geom, start_date, end_date):
@@ -38,16 +111,19 @@ def overlaps_queryset(geom, start_date, end_date):
                 SELECT *,
                     ST_Difference(
                         territory,
-                        ST_MakeValid(%(geom)s::geometry)
+                        ST_MakeValid(ST_GeomFromEWKB(%(geom)s))
                     ) as diff
                 FROM (
                     SELECT *
                     FROM api_spacetimevolume as stv
-                    WHERE stv.end_date >= %(start_date)s::numeric(10,1)
-                        AND stv.start_date <= %(end_date)s::numeric(10,1)
+                    WHERE stv.during && numrange(
+                            %(start_date)s::numeric(10,1),
+                            %(end_date)s::numeric(10,1),
+                            '[]'
+                        )
                         AND ST_Intersects(
                             territory,
-                        ST_MakeValid(%(geom)s::geometry))
+                        ST_MakeValid(ST_GeomFromEWKB(%(geom)s)))
                 ) as foo
             ) as foo
         ) as foo
@@ -55,7 +131,7 @@ def overlaps_queryset(geom, start_date, end_date):
         GROUP BY id, entity_id, start_date, end_date
         """,
         {
-            "geom": geom.ewkt,
+            "geom": ewkb(geom),
             "start_date": start_date,
             "end_date": end_date,
             "tolerance": AREA_TOLERANCE,
@@ -64,23 +140,40 @@ def overlaps_queryset(geom, start_date, end_date):
 
 
 def subtract_geometry(req_overlaps, overlaps, geom):
-    """Perform actions on db"""
+    """
+    Clip the new geometry by kept STVs and modified STVs by the clipped
+    geometry in a single statement, modified STVs left too small are deleted
+    """
     for entity, stvs in overlaps["db"].items():
-        overlaps["keep" if str(entity) not in req_overlaps else "modify"].extend(
-            SpacetimeVolume.objects.filter(pk__in=stvs)
-        )
+        overlaps["keep" if str(entity) not in req_overlaps else "modify"].extend(stvs)
 
-    # Important to subtract from staging geometry first
-    for overlap in overlaps["keep"]:
-        geom = geom_difference(geom, overlap.territory)
+    if overlaps["modify"]:
+        # Tiles covered by territory before it's clipped
+        bump_tile_versions(
+            "api_spacetimevolume.id = ANY(%(ids)s)", {"ids": overlaps["modify"]}
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SUBTRACT_GEOMETRY,
+            {
+                "geom": ewkb(geom),
+                "keep": overlaps["keep"],
+                "modify": overlaps["modify"],
+                "tolerance": AREA_TOLERANCE,
+            },
+        )
+        territory, area, updated, entities, removed = cursor.fetchone()
 
-    if calculate_area(geom) < AREA_TOLERANCE:
+    if area is None or area < AREA_TOLERANCE:
         raise ValidationError("Polygon is too small")
 
-    for overlap in overlaps["modify"]:
-        overlap.territory = geom_difference(overlap.territory, geom)
-        if calculate_area(overlap.territory) < AREA_TOLERANCE:
-            overlap.delete()
-        else:
-            overlap.save()
-    return geom
+    if updated:
+        # Clipped STVs are updated in SQL, their signals don't run: tiles were
+        # bumped for the territory before clipping, which covers the new one
+        update_simplified_territory(updated)
+        update_te_list_fragments(entities)
+        if "cacheops" in settings.INSTALLED_APPS:
+            transaction.on_commit(lambda: invalidate_model(SpacetimeVolume))
+    for overlap in SpacetimeVolume.objects.filter(pk__in=removed):
+        overlap.delete()
+    return GEOSGeometry(territory)
@@ -0,0 +1,51 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+
+def parse_ints(arr):
+    """keep only integers in array"""
+    res = []
+    for i in arr:
+        try:
+            clean = int(i)
+            res.append(clean)
+        except ValueError:
+            pass
+    return res
+
+
+def parse_date(value):
+    """
+    JDN from query string, None if not provided.
+    Dates keep their fraction, like decimal JDN fields of the models,
+    ValueError is raised for malformed and non-finite values.
+    """
+    if value is None:
+        return None
+    try:
+        date = Decimal(value)
+    except InvalidOperation:
+        raise ValueError("Use JDN for dates")
+    if not date.is_finite():
+        raise ValueError("Use JDN for dates")
+    return date
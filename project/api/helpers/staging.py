@@ -0,0 +1,66 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from api.models import StagedTerritory
+from .geometry import ewkb
+
+# Staged territory of tasks which never ran is deleted after this
+STAGED_TERRITORY_EXPIRY = timedelta(days=1)
+
+
+def stage_territory(geom):
+    """
+    Store geometry for a task, returns staging id and checksum
+    """
+    data = ewkb(geom)
+    checksum = hashlib.sha256(data).hexdigest()
+    staged = StagedTerritory.objects.create(ewkb=data, checksum=checksum)
+    return staged.pk, checksum
+
+
+def unstage_territory(staged_id, checksum):
+    """
+    Remove staged geometry and return it's EWKB
+    """
+    staged = StagedTerritory.objects.filter(pk=staged_id).first()
+    if staged is None:
+        raise ValidationError("Staged territory is missing or expired")
+    data = bytes(staged.ewkb)
+    if hashlib.sha256(data).hexdigest() != checksum:
+        raise ValidationError("Staged territory checksum mismatch")
+    staged.delete()
+    return data
+
+
+def delete_expired_staged_territories():
+    """
+    Delete staged geometry older than STAGED_TERRITORY_EXPIRY
+    """
+    deleted, _ = StagedTerritory.objects.filter(
+        created__lt=timezone.now() - STAGED_TERRITORY_EXPIRY
+    ).delete()
+    return deleted
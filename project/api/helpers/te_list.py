@@ -0,0 +1,276 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import gzip
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Changes are kept for clients which synced within this period,
+# older cursors have to reload territorial-entities/list
+TE_CHANGES_RETENTION = timedelta(days=30)
+
+# Shape of one element of territorial-entities/list
+TE_LIST_FRAGMENT = """
+    SELECT id, wikidata_id, color_id AS color, admin_level,
+        dissolution_date, inception_date, label,
+        COALESCE(stvs, '[]'::json) AS stvs,
+        COALESCE(json_array_length(stvs), 0) AS stv_count
+    FROM api_territorialentity
+    LEFT JOIN LATERAL (
+        SELECT json_agg(row_to_json(foo)) AS stvs FROM (
+            SELECT
+                entity_id as entity,
+                id,
+                start_date,
+                end_date,
+                ST_AsGeoJSON(visual_center)::json AS visual_center,
+                "references"
+            FROM api_spacetimevolume
+            WHERE entity_id = api_territorialentity.id
+        ) as foo
+    ) AS stvs ON TRUE
+    WHERE {}
+"""
+
+
+def bump_te_list_version():
+    """Next version of territorial-entities/list"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval('api_telist_version_seq')")
+        return cursor.fetchone()[0]
+
+
+def te_list_version():
+    """Current version of territorial-entities/list"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT last_value FROM api_telist_version_seq")
+        return cursor.fetchone()[0]
+
+
+def update_te_list_fragments(ids=None):
+    """
+    Rebuild list fragments of entities, all of them if ids are not provided.
+    Fragments of deleted entities are removed.
+    Entities are logged for territorial-entities/changes once per txid.
+    Version is bumped right away, so the transaction itself sees the change,
+    and once more after commit, so snapshots built by other connections
+    in the meantime from uncommitted data are not served.
+    """
+    condition = "TRUE" if ids is None else "id = ANY(%(ids)s)"
+    with connection.cursor() as cursor:
+        if ids is None:
+            cursor.execute("DELETE FROM api_telistfragment")
+        else:
+            cursor.execute(
+                "DELETE FROM api_telistfragment WHERE entity_id = ANY(%(ids)s)",
+                {"ids": ids},
+            )
+        cursor.execute(
+            """
+            INSERT INTO api_telistfragment (entity_id, fragment)
+            SELECT id, row_to_json(foo)::text FROM ({}) AS foo
+            """.format(  # nosec
+                TE_LIST_FRAGMENT.format(condition)
+            ),
+            {"ids": ids},
+        )
+        cursor.execute(
+            """
+            INSERT INTO api_telistchange (entity_id, txid, created)
+            SELECT id, txid_current(), now() FROM {}
+            ON CONFLICT DO NOTHING
+            """.format(  # nosec
+                "api_territorialentity"
+                if ids is None
+                else "unnest(%(ids)s::integer[]) AS id"
+            ),
+            {"ids": ids},
+        )
+    bump_te_list_version()
+    transaction.on_commit(bump_te_list_version)
+
+
+def log_deleted_stvs(ids):
+    """
+    Log deleted STVs for territorial-entities/changes under the txid
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO api_telistchange (stv_id, txid, created)
+            SELECT id, txid_current(), now() FROM unnest(%(ids)s::integer[]) AS id
+            ON CONFLICT DO NOTHING
+            """,
+            {"ids": ids},
+        )
+
+
+def te_changes_horizon():
+    """
+    Oldest sync cursor territorial-entities/changes is complete for
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT COALESCE(MAX(txid), 0) FROM api_telistchange
+            WHERE entity_id IS NULL AND stv_id IS NULL
+            """
+        )
+        return cursor.fetchone()[0]
+
+
+def delete_expired_te_changes():
+    """
+    Delete changes older than TE_CHANGES_RETENTION and move the horizon
+    above them, snapshots with a sync cursor below it are rebuilt on request
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            WITH deleted AS (
+                DELETE FROM api_telistchange WHERE created < %(expired)s
+                RETURNING entity_id, stv_id, txid
+            )
+            INSERT INTO api_telistchange (txid, created)
+            SELECT MAX(
+                CASE WHEN entity_id IS NULL AND stv_id IS NULL
+                THEN txid ELSE txid + 1 END
+            ), now()
+            FROM deleted HAVING COUNT(*) > 0
+            RETURNING txid
+            """,
+            {"expired": timezone.now() - TE_CHANGES_RETENTION},
+        )
+        horizon = cursor.fetchone()
+        if horizon is None:
+            return te_changes_horizon()
+        cursor.execute("DELETE FROM api_telistsnapshot WHERE sync_cursor < %s", horizon)
+        cursor.execute(
+            """
+            DELETE FROM api_telistchange
+            WHERE entity_id IS NULL AND stv_id IS NULL AND txid < %s
+            """,
+            horizon,
+        )
+        return horizon[0]
+
+
+def build_te_list_snapshot(version):
+    """
+    Join fragments into territorial-entities/list document,
+    store it compressed under the version
+    and return (gzip, brotli, sync_cursor) of it
+    """
+    with connection.cursor() as cursor:
+        # Sync cursor is taken from the snapshot of the same statement
+        cursor.execute(
+            """
+            SELECT
+                '[' || COALESCE(string_agg(fragment, ',' ORDER BY entity_id), '')
+                || ']',
+                txid_snapshot_xmin(txid_current_snapshot())
+            FROM api_telistfragment
+            """
+        )
+        data, sync_cursor = cursor.fetchone()
+        data = data.encode("utf-8")
+        payloads = (
+            gzip.compress(data, compresslevel=9),
+            brotli.compress(data) if brotli is not None else None,
+            sync_cursor,
+        )
+        # Concurrent builds of a newer version take precedence
+        cursor.execute(
+            """
+            INSERT INTO api_telistsnapshot (id, version, gzip, brotli, sync_cursor)
+            VALUES (1, %s, %s, %s, %s)
+            ON CONFLICT (id) DO UPDATE
+            SET version = EXCLUDED.version,
+                gzip = EXCLUDED.gzip,
+                brotli = EXCLUDED.brotli,
+                sync_cursor = EXCLUDED.sync_cursor
+            WHERE api_telistsnapshot.version < EXCLUDED.version
+            """,
+            [version, *payloads],
+        )
+    return payloads
+
+
+def te_list_snapshot(version):
+    """Stored (gzip, brotli, sync_cursor) of the version, built if missing"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT gzip, brotli, sync_cursor FROM api_telistsnapshot
+            WHERE version = %s
+            """,
+            [version],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return build_te_list_snapshot(version)
+    return bytes(row[0]), None if row[1] is None else bytes(row[1]), row[2]
+
+
+def te_list_changes(since):
+    """
+    Fragments of entities changed by transactions with txid >= since,
+    directly or through their STVs, ids of entities and STVs deleted by them,
+    and the cursor to pass as since next time.
+    Transactions not committed yet when the cursor is taken have txid
+    above it, so changes are never skipped, but might be returned twice.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            WITH changes AS (
+                SELECT entity_id, stv_id FROM api_telistchange
+                WHERE txid >= %(since)s
+            ), te_changes AS (
+                SELECT DISTINCT entity_id AS id FROM changes
+                WHERE entity_id IS NOT NULL
+            )
+            SELECT
+                array_remove(array_agg(fragment ORDER BY id), NULL),
+                array_agg(id ORDER BY id) FILTER (WHERE fragment IS NULL),
+                ARRAY(
+                    SELECT DISTINCT stv_id FROM changes
+                    WHERE stv_id IS NOT NULL AND NOT EXISTS (
+                        SELECT FROM api_spacetimevolume
+                        WHERE api_spacetimevolume.id = changes.stv_id
+                    )
+                    ORDER BY stv_id
+                ),
+                txid_snapshot_xmin(txid_current_snapshot())
+            FROM te_changes
+            LEFT JOIN api_telistfragment ON entity_id = te_changes.id
+            """,
+            {"since": since},
+        )
+        fragments, deleted_entities, deleted_stvs, sync_cursor = cursor.fetchone()
+    return fragments or [], deleted_entities or [], deleted_stvs, sync_cursor
@@ -0,0 +1,164 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+from .tile_versions import tile_version
+
+
+class LRUTileCache:
+    """
+    In-process LRU cache bounded by the total size of stored tiles
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value or None"""
+        with self._lock:
+            item = self._tiles.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._tiles.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        """Store (etag, tile) value, evicting least recently used tiles"""
+        if len(value[1]) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._tiles[key] = (value, time.monotonic() + timeout)
+            self.size += len(value[1])
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._tiles)))
+
+    def clear(self):
+        """Remove all tiles"""
+        with self._lock:
+            self._tiles.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        item = self._tiles.pop(key, None)
+        if item is not None:
+            self.size -= len(item[0][1])
+
+
+TILES = LRUTileCache(settings.MVT_CACHE_MAX_BYTES)
+
+
+def tile_cache_key(layer, zoom, x_coor, y_coor, params, version=None):
+    """Cache key for the tile, its filter params and data version"""
+    return "mvt:{}:{}:{}:{}:{}:{}".format(
+        layer, zoom, x_coor, y_coor, urlencode(sorted(params), doseq=True), version
+    )
+
+
+def tile_etag(tile):
+    """Strong ETag derived from tile content"""
+    return '"{}"'.format(hashlib.sha1(tile).hexdigest())  # nosec
+
+
+def cache_get(key):
+    """Look up the tile in-process first, then in Redis"""
+    value = TILES.get(key)
+    if value is None:
+        try:
+            value = caches[settings.MVT_CACHE_ALIAS].get(key)
+        except Exception:  # pylint: disable=W0703
+            # Tiles are served from the database while Redis is unavailable
+            value = None
+        if value is not None:
+            TILES.set(key, value, settings.MVT_CACHE_TIMEOUT)
+    return value
+
+
+def cache_set(key, value):
+    """Store the tile in both cache levels"""
+    TILES.set(key, value, settings.MVT_CACHE_TIMEOUT)
+    try:
+        caches[settings.MVT_CACHE_ALIAS].set(key, value, settings.MVT_CACHE_TIMEOUT)
+    except Exception:  # pylint: disable=W0703
+        pass
+
+
+def cached_tile(layer, versioned=False):
+    """
+    Cache tiles returned by MVT view and answer If-None-Match with 304
+    Empty tiles are cached as well and served with 204.
+    Versioned layers are invalidated as soon as tile version is bumped.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, zoom, x_coor, y_coor, **kwargs):
+            key = tile_cache_key(
+                layer,
+                zoom,
+                x_coor,
+                y_coor,
+                list(kwargs.items()) + list(request.GET.lists()),
+                tile_version(zoom, x_coor, y_coor)
+                if versioned and settings.MVT_CACHE_ENABLED
+                else None,
+            )
+            value = cache_get(key) if settings.MVT_CACHE_ENABLED else None
+            if value is None:
+                # URL parameters are passed by name, like Django does
+                response = view(
+                    request, zoom=zoom, x_coor=x_coor, y_coor=y_coor, **kwargs
+                )
+                if response.status_code not in (200, 204):
+                    return response
+                tile = bytes(response.content) if response.status_code == 200 else b""
+                value = (tile_etag(tile), tile)
+                if settings.MVT_CACHE_ENABLED:
+                    cache_set(key, value)
+
+            etag, tile = value
+            if not tile:
+                return HttpResponse(status=204)
+            response = HttpResponse(tile, content_type="application/x-protobuf")
+            response["ETag"] = etag
+            return get_conditional_response(request, etag=etag, response=response)
+
+        return wrapper
+
+    return decorator
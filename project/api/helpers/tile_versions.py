@@ -0,0 +1,134 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+# Tiles of deeper zoom levels share the version of their TileLayout ancestor
+TILE_VERSION_KEY = "mvt-version:{}:{}:{}"
+
+
+def layout_tile(zoom, x_coor, y_coor):
+    """TileLayout cell which contains provided tile"""
+    shift = max(zoom - settings.MVT_LAYOUT_ZOOM, 0)
+    return zoom - shift, x_coor >> shift, y_coor >> shift
+
+
+def publish_versions(rows):
+    """Store new tile versions in Redis"""
+    try:
+        caches[settings.MVT_CACHE_ALIAS].set_many(
+            {TILE_VERSION_KEY.format(*row[:3]): row[3] for row in rows}, None
+        )
+    except Exception:  # pylint: disable=W0703
+        pass
+
+
+def bump_tile_versions(condition, params):
+    """
+    Assign new versions to TileLayout cells intersecting territory of STVs
+    which match the condition and queue them for MVT regeneration.
+    Versions are published after commit, so tiles are never cached
+    with new version and old data.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            WITH bumped AS (
+                UPDATE api_tilelayout
+                SET version = nextval('api_tilelayout_version_seq')
+                FROM (
+                    SELECT DISTINCT api_tilelayout.id
+                    FROM api_spacetimevolume
+                    JOIN api_tilelayout
+                    ON ST_Intersects(api_tilelayout.bbox, api_spacetimevolume.territory)
+                    WHERE {}
+                ) AS affected
+                WHERE api_tilelayout.id = affected.id
+                RETURNING zoom, x_coor, y_coor, version
+            ), queued AS (
+                INSERT INTO api_dirtytile (zoom, x_coor, y_coor)
+                SELECT zoom, x_coor, y_coor FROM bumped
+                ON CONFLICT DO NOTHING
+            )
+            SELECT zoom, x_coor, y_coor, version FROM bumped
+            """.format(  # nosec
+                condition
+            ),
+            params,
+        )
+        rows = cursor.fetchall()
+    if len(rows) > 0:
+        transaction.on_commit(lambda: publish_versions(rows))
+    return rows
+
+
+def bump_layout_versions(condition, params):
+    """
+    Assign new versions to TileLayout cells which match the condition
+    without queueing them, their MVTLayers rows are being regenerated.
+    Tiles cached between the STV change and the regeneration are stored
+    with the previous version and are not served after commit.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE api_tilelayout
+            SET version = nextval('api_tilelayout_version_seq')
+            WHERE {}
+            RETURNING zoom, x_coor, y_coor, version
+            """.format(  # nosec
+                condition
+            ),
+            params,
+        )
+        rows = cursor.fetchall()
+    if len(rows) > 0:
+        transaction.on_commit(lambda: publish_versions(rows))
+    return rows
+
+
+def tile_version(zoom, x_coor, y_coor):
+    """Current version of the tile, Redis first, then TileLayout"""
+    cell = layout_tile(zoom, x_coor, y_coor)
+    key = TILE_VERSION_KEY.format(*cell)
+    try:
+        version = caches[settings.MVT_CACHE_ALIAS].get(key)
+    except Exception:  # pylint: disable=W0703
+        version = None
+    if version is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT version FROM api_tilelayout
+                WHERE zoom = %s AND x_coor = %s AND y_coor = %s
+                """,
+                cell,
+            )
+            row = cursor.fetchone()
+        version = 0 if row is None else row[0]
+        try:
+            # Don't overwrite version published by a concurrent commit
+            caches[settings.MVT_CACHE_ALIAS].add(key, version, None)
+        except Exception:  # pylint: disable=W0703
+            pass
+    return version
@@ -0,0 +1,111 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import timeit
+
+from django.contrib.gis.db.models.functions import NumPoints
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.models import SpacetimeVolume
+from api.helpers.geometry import ewkb
+
+
+def ewkt_round_trip(cursor, geom):
+    """
+    Send geometry to PostGIS and read it back as EWKT
+    """
+    cursor.execute("SELECT ST_AsEWKT(ST_GeomFromEWKT(%(geom)s))", {"geom": geom.ewkt})
+    return GEOSGeometry(cursor.fetchone()[0])
+
+
+def ewkb_round_trip(cursor, geom):
+    """
+    Send geometry to PostGIS and read it back as binary EWKB
+    """
+    cursor.execute("SELECT ST_AsEWKB(ST_GeomFromEWKB(%(geom)s))", {"geom": ewkb(geom)})
+    return GEOSGeometry(cursor.fetchone()[0])
+
+
+def best_time(function, repeat):
+    """
+    Best time of repeated calls in milliseconds
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1000
+
+
+def measure(cursor, geom, repeat):
+    """
+    Sizes in KB and format and round-trip times of EWKT and EWKB
+    """
+    return [
+        len(geom.ewkt) / 1024,
+        len(ewkb(geom)) / 1024,
+        best_time(lambda: geom.ewkt, repeat),
+        best_time(lambda: ewkb(geom), repeat),
+        best_time(lambda: ewkt_round_trip(cursor, geom), repeat),
+        best_time(lambda: ewkb_round_trip(cursor, geom), repeat),
+    ]
+
+
+HEADER = (
+    "stv",
+    "points",
+    "ewkt KB",
+    "ewkb KB",
+    "ewkt fmt",
+    "ewkb fmt",
+    "ewkt rt",
+    "ewkb rt",
+)
+ROW = "{:>8} {:>9} {:>10.1f} {:>10.1f} {:>7.1f}ms {:>7.1f}ms {:>7.1f}ms {:>7.1f}ms"
+
+
+class Command(BaseCommand):
+    """
+    Micro-benchmark of EWKT and EWKB geometry transport on the largest STVs
+    """
+
+    help = "Compare EWKT and EWKB geometry transport on the largest stored STVs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count", type=int, default=10, help="Number of largest STVs to use"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Best time of this many runs"
+        )
+
+    def handle(self, *args, **options):
+        stvs = (
+            SpacetimeVolume.objects.annotate(points=NumPoints("territory"))
+            .only("id", "territory")
+            .order_by("-points")[: options["count"]]
+        )
+        print("{:>8} {:>9} {:>10} {:>10} {:>9} {:>9} {:>9} {:>9}".format(*HEADER))
+        totals = [0.0] * 6
+        with connection.cursor() as cursor:
+            for stv in stvs:
+                row = measure(cursor, stv.territory, options["repeat"])
+                totals = [total + value for total, value in zip(totals, row)]
+                print(ROW.format(stv.pk, stv.points, *row))
+        print(ROW.format("total", "", *totals))
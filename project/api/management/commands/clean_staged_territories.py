@@ -0,0 +1,37 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.helpers.staging import delete_expired_staged_territories
+
+
+class Command(BaseCommand):
+    """
+    Deletes expired STV uploads left by tasks which never ran
+    """
+
+    help = "Deletes expired staged STV territories"
+
+    def handle(self, *args, **options):
+        print(
+            "Deleted {} staged territories".format(delete_expired_staged_territories())
+        )
@@ -24,8 +24,9 @@ from django.contrib.gis.geos import GEOSGeometry
 from django.core.management.base import BaseCommand
 from django.contrib.gis.db.models.functions import MakeValid
 
-from api.models import TerritorialEntity, SpacetimeVolume
+from api.models import TerritorialEntity, SpacetimeVolume, jdn_range
 from api.helpers.geometry import find_difference, calculate_area
+from api.helpers.mvt import update_simplified_territory
 
 
 def pairwise(iterable):
@@ -46,6 +47,7 @@ def make_stvs_valid(entity):
                 )
             )
             stvs.filter(id=stv.id).update(territory=MakeValid("territory"))
+            update_simplified_territory([stv.id])
 
 
 def fix_antimeridian(timestamp=None):
@@ -108,6 +110,7 @@ def fix_antimeridian(timestamp=None):
             )
             affected = cursor.rowcount
             print("{} rows affected".format(affected))
+            update_simplified_territory(ids)
 
 
 @transaction.atomic
@@ -135,7 +138,7 @@ def handle_te_time(entity):
             continue
 
         overlaps = SpacetimeVolume.objects.filter(
-            entity=entity, start_date__lte=start, end_date__gte=end
+            entity=entity, during__contains=jdn_range(start, end)
         )
         if overlaps.count() == 1:
             stv = overlaps[0]
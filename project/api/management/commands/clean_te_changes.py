@@ -0,0 +1,35 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.helpers.te_list import delete_expired_te_changes
+
+
+class Command(BaseCommand):
+    """
+    Deletes expired territorial-entities/changes log
+    """
+
+    help = "Deletes territorial-entities/changes log older than its retention"
+
+    def handle(self, *args, **options):
+        print("Changes are kept since txid {}".format(delete_expired_te_changes()))
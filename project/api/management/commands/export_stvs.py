@@ -0,0 +1,88 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import gzip
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.helpers.export import stv_export_filters, stv_features
+
+
+def write_features(path, features, compress=False):
+    """
+    Write one Feature per line to a temporary file next to path
+    and move it into place once complete, readers never see a partial file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".stv-", suffix=".tmp")
+    count = 0
+    try:
+        with os.fdopen(fd, "wb") as raw:
+            out = gzip.GzipFile(fileobj=raw, mode="wb") if compress else raw
+            try:
+                for feature in features:
+                    out.write(feature.encode("utf-8"))
+                    out.write(b"\n")
+                    count += 1
+            finally:
+                if compress:
+                    out.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return count
+
+
+class Command(BaseCommand):
+    """Export STVs as newline-delimited GeoJSON for tippecanoe"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int, help="STVs to export")
+        parser.add_argument(
+            "--timestamp",
+            type=int,
+            help="Export only STVs changed since this unix timestamp",
+        )
+        parser.add_argument("--output", help="Target file", default="/data/stv.json")
+        parser.add_argument(
+            "--gzip", action="store_true", help="Compress output with gzip"
+        )
+
+    def handle(self, *args, **options):
+        where, params = stv_export_filters(
+            ids=options["ids"], since=options["timestamp"]
+        )
+        started = time.monotonic()
+        count = write_features(
+            options["output"], stv_features(where, params), options["gzip"]
+        )
+        print(
+            "Exported {} STVs to {} in {:.1f}s".format(
+                count, options["output"], time.monotonic() - started
+            )
+        )
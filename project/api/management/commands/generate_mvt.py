@@ -17,145 +17,310 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import os
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+from datetime import timedelta
+from itertools import groupby, islice
+from multiprocessing import get_context
+
 from django import db
+from django.db import transaction
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from api.models import TileLayout, MVTLayers
-from api.views.endpoints.mvt_stv import stv_mvt_geom_query
+from api.models import TileLayout, MVTLayers, DirtyTile
+from api.helpers.mvt import (
+    stv_mvt_geom_query,
+    stv_mvt_params,
+    stv_mvt_layer,
+    date_bucket,
+    update_simplified_territory,
+    update_topology_territory,
+)
+from api.helpers.tile_versions import bump_layout_versions
 
 from .clean_stvs import fix_antimeridian
 
 try:
-    THREADS = os.cpu_count() - 1
+    JOBS = max(os.cpu_count() - 1, 1)
 except TypeError:
-    THREADS = 1
-THREADS = int(os.environ.get("MVT_THREADS", THREADS))
+    JOBS = 1
+JOBS = int(os.environ.get("MVT_THREADS", JOBS))
 
-ZOOM = int(os.environ.get("ZOOM", 8))
+ZOOM = settings.MVT_LAYOUT_ZOOM
 
+# Tiles rendered and stored by one INSERT statement
+BATCH_SIZE = int(os.environ.get("MVT_BATCH_SIZE", 16))
 
-def split_list(alist, wanted_parts=1):
-    """Split array into smaller arrays"""
-    length = len(alist)
-    return [
-        alist[i * length // wanted_parts : (i + 1) * length // wanted_parts]
-        for i in range(wanted_parts)
-    ]
+# Seconds between progress reports
+PROGRESS_INTERVAL = 10
 
 
-def create_tile_layout(zoom, x_coor, y_coor):
-    """Add one TileLayout entity with plain SQL query"""
+def populate_tile_layout(zoom, tiles):
+    """Populate TileLayout table"""
+    if len(TileLayout.objects.filter(zoom=zoom)) != 0:
+        return False
     with db.connection.cursor() as cursor:
         cursor.execute(
             """
             INSERT INTO api_tilelayout (zoom, x_coor, y_coor, bbox)
-            SELECT *, TileBBOX(zoom, x_coor, y_coor, 4326) AS bbox
-            FROM ( SELECT %s AS zoom, %s AS x_coor, %s AS y_coor ) AS f
+            SELECT %(zoom)s, x_coor, y_coor, TileBBox(%(zoom)s, x_coor, y_coor, 4326)
+            FROM generate_series(0, %(tiles)s - 1) AS x_coor
+            CROSS JOIN generate_series(0, %(tiles)s - 1) AS y_coor
             """,
-            [zoom, x_coor, y_coor],
+            {"zoom": zoom, "tiles": tiles},
         )
+    return True
 
 
-def populate_tile_layout(zoom, tiles):
-    """Populate TileLayout table"""
-    if len(TileLayout.objects.filter(zoom=zoom)) != 0:
-        return False
-    for y_coor in range(0, tiles):
-        for x_coor in range(0, tiles):
-            create_tile_layout(zoom, x_coor, y_coor)
-    return True
+def covered_tiles(zoom, parents):
+    """
+    Tiles of the zoom level which intersect any STV.
+    Only children of covered parent tiles are checked, so empty subtrees
+    are pruned. Tile (0, 0) is the parent for zoom 0.
+    """
+    x_coors, y_coors = zip(*parents) if len(parents) > 0 else ([], [])
+    with db.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT api_tilelayout.x_coor, api_tilelayout.y_coor
+            FROM api_tilelayout
+            JOIN unnest(%(x_coors)s::integer[], %(y_coors)s::integer[])
+                AS parent(x_coor, y_coor)
+            ON api_tilelayout.x_coor / 2 = parent.x_coor
+                AND api_tilelayout.y_coor / 2 = parent.y_coor
+            WHERE api_tilelayout.zoom = %(zoom)s AND EXISTS (
+                SELECT 1 FROM api_spacetimevolume
+                WHERE ST_Intersects(territory, api_tilelayout.bbox)
+            )
+            ORDER BY api_tilelayout.x_coor, api_tilelayout.y_coor
+            """,
+            {"zoom": zoom, "x_coors": list(x_coors), "y_coors": list(y_coors)},
+        )
+        return cursor.fetchall()
 
 
-def create_mvt_stv(zoom, x_coor, y_coor):
-    """Mapbox Vector Tiles for Political Borders"""
+def remove_uncovered_tiles(zoom, coverage):
+    """Remove STV tiles which no longer intersect any STV"""
+    x_coors, y_coors = zip(*coverage) if len(coverage) > 0 else ([], [])
+    with db.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            DELETE FROM api_mvtlayers
+            WHERE zoom = %(zoom)s AND (layer = 'stv' OR layer LIKE 'stv:%%')
+            AND NOT EXISTS (
+                SELECT 1
+                FROM unnest(%(x_coors)s::integer[], %(y_coors)s::integer[])
+                    AS covered(x_coor, y_coor)
+                WHERE covered.x_coor = api_mvtlayers.x_coor
+                    AND covered.y_coor = api_mvtlayers.y_coor
+            )
+            """,
+            {"zoom": zoom, "x_coors": list(x_coors), "y_coors": list(y_coors)},
+        )
+        return cursor.rowcount
+
+
+def create_mvt_stv(zoom, coords, bucket=None):
+    """Mapbox Vector Tiles for Political Borders, a batch of one zoom level"""
+    layer, where, dates = stv_mvt_layer(bucket)
+    x_coors, y_coors = zip(*coords)
     with db.connection.cursor() as cursor:
         cursor.execute(
             """
             INSERT INTO api_mvtlayers (zoom, x_coor, y_coor, layer, tile)
-            SELECT
-                %(zoom)s AS zoom
-                , %(x_coor)s AS x_coor
-                , %(y_coor)s AS y_coor
-                , 'stv' AS layer
-                , ST_AsMVT(a, 'stv') AS tile
-            FROM ({}) AS a
+            SELECT %(zoom)s, t.x_coor, t.y_coor, %(layer)s, mvt.tile
+            FROM unnest(%(x_coors)s::integer[], %(y_coors)s::integer[])
+                AS t(x_coor, y_coor)
+            CROSS JOIN LATERAL (
+                SELECT COALESCE(ST_AsMVT(a, 'stv'), ''::bytea) AS tile FROM ({}) AS a
+            ) AS mvt
             ON CONFLICT (zoom, x_coor, y_coor, layer) DO UPDATE SET tile = EXCLUDED.tile
             """.format(  # nosec
-                stv_mvt_geom_query(zoom)
+                stv_mvt_geom_query(zoom, where, "t.x_coor", "t.y_coor")
+            ),
+            stv_mvt_params(
+                zoom, layer=layer, x_coors=list(x_coors), y_coors=list(y_coors), **dates
             ),
-            {
-                "zoom": zoom,
-                "x_coor": x_coor,
-                "y_coor": y_coor,
-            },
         )
 
 
-def mvt_worker(zoom, tiles, total, update, t_id):
-    """Start MVT updating process"""
+def stv_date_buckets():
+    """Era buckets covered by STVs"""
+    with db.connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(start_date), MAX(end_date) FROM api_spacetimevolume")
+        start, end = cursor.fetchone()
+    if start is None:
+        return []
+    return list(range(date_bucket(start), date_bucket(end) + 1))
+
+
+def tile_batches(tiles, batch_size):
+    """Split (zoom, x, y) tiles sorted by zoom into batches of one zoom level"""
+    for zoom, group in groupby(tiles, key=lambda tile: tile[0]):
+        coords = ((x_coor, y_coor) for _, x_coor, y_coor in group)
+        while True:
+            batch = list(islice(coords, batch_size))
+            if len(batch) == 0:
+                break
+            yield zoom, batch
+
+
+def mvt_worker(zoom, coords, buckets):
+    """Render one batch in a pool process"""
+    # Django opens a connection on first query and keeps it for the worker lifetime
+    for bucket in buckets:
+        create_mvt_stv(zoom, coords, bucket)
+    return len(coords)
+
+
+class Progress:
+    """Report rendered tiles and ETA"""
+
+    def __init__(self, label, total, unit="tiles"):
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.started = self.reported = time.monotonic()
+
+    def report(self):
+        """Print current state"""
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0
+        eta = (self.total - self.done) / rate if rate > 0 else 0
+        print(
+            "{}: {}/{} {} ({:.1f}%), {:.1f} {}/s, elapsed {}, ETA {}".format(
+                self.label,
+                self.done,
+                self.total,
+                self.unit,
+                100.0 * self.done / max(self.total, 1),
+                rate,
+                self.unit,
+                timedelta(seconds=round(elapsed)),
+                timedelta(seconds=round(eta)),
+            )
+        )
+        self.reported = time.monotonic()
+
+    def update(self, done):
+        """Account rendered tiles"""
+        self.done += done
+        if time.monotonic() - self.reported >= PROGRESS_INTERVAL:
+            self.report()
+
+
+def populate_mvt_stv_layer(label, tiles, total, buckets=(None,), **options):
+    """
+    Populate MVTLayer table with STV
+    None in buckets stands for the layer with all eras.
+    Batches are pulled by the pool workers one at a time, so workers which got
+    cheap ocean tiles keep taking new work while others render the land.
+    """
+    progress = Progress(label, total)
+    # Forked workers must not share the parent's connection
     db.connections.close_all()
-    if not update:
-        print("Thread #{}, Tiles {}".format(t_id, tiles))
-        for y_coor in range(0, total):
-            for x_coor in tiles:
-                create_mvt_stv(zoom, x_coor, y_coor)
-    else:
-        print("Thread #{} Updating {} tiles".format(t_id, len(tiles)))
-        for tile in tiles:
-            create_mvt_stv(tile.zoom, tile.x_coor, tile.y_coor)
-    os._exit(0)  # pylint: disable=protected-access
-
-
-def populate_mvt_stv_layer(zoom, tile_set, update=False):
-    """Populate MVTLayer table with STV"""
-    tiles = (
-        split_list(tile_set, THREADS)
-        if update
-        else split_list(range(0, tile_set), THREADS)
-    )
-    pids = []
+    with ProcessPoolExecutor(
+        max_workers=options.get("jobs", JOBS), mp_context=get_context("fork")
+    ) as pool:
+        futures = [
+            pool.submit(mvt_worker, zoom, coords, buckets)
+            for zoom, coords in tile_batches(
+                tiles, options.get("batch_size", BATCH_SIZE)
+            )
+        ]
+        for future in as_completed(futures):
+            progress.update(future.result())
+    progress.report()
+
+
+def topology_worker(bucket):
+    """Simplify shared borders of one era bucket in a pool process"""
+    update_topology_territory(bucket)
+    return 1
+
+
+def populate_topology(buckets, **options):
+    """Build topology-preserving simplified territory for era buckets"""
+    progress = Progress("Topology", len(buckets), "buckets")
     db.connections.close_all()
-    for t_id in range(0, THREADS):
-        newpid = os.fork()
-        if newpid == 0:
-            mvt_worker(zoom, tiles[t_id], tile_set, update, t_id)
-        else:
-            pids.append(newpid)
-    for pid in pids:
-        os.waitpid(pid, 0)
-
-
-def update_affected_mvts(timestamp):
-    """Update tiles based on history"""
-    tiles = TileLayout.objects.raw(
-        """
-        SELECT DISTINCT id, zoom, x_coor, y_coor FROM (
-            SELECT territory FROM (
-                SELECT api_historicalspacetimevolume.id, api_historicalspacetimevolume.history_date
-                , api_historicalspacetimevolume.territory
-                FROM api_historicalspacetimevolume
-                UNION
-                SELECT api_spacetimevolume.id, api_historicalterritorialentity.history_date
-                , api_spacetimevolume.territory
-                FROM api_spacetimevolume
-                JOIN api_historicalterritorialentity
-                ON api_historicalterritorialentity.id = entity_id
-                JOIN api_territorialentity
-                ON api_territorialentity.id = entity_id
-                WHERE NOT (
-                api_historicalterritorialentity.color_id=api_territorialentity.color_id
-                AND api_historicalterritorialentity.admin_level=api_territorialentity.admin_level
+    with ProcessPoolExecutor(
+        max_workers=options.get("jobs", JOBS), mp_context=get_context("fork")
+    ) as pool:
+        futures = [pool.submit(topology_worker, bucket) for bucket in buckets]
+        for future in as_completed(futures):
+            progress.update(future.result())
+    progress.report()
+
+
+def drain_worker(batch_size, buckets):
+    """
+    Claim a batch of dirty tiles and regenerate them in one transaction.
+    Locked rows are skipped, so workers never wait for each other,
+    and tiles return to the queue if rendering fails.
+    """
+    with transaction.atomic():
+        with db.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                DELETE FROM api_dirtytile WHERE id IN (
+                    SELECT id FROM api_dirtytile
+                    ORDER BY zoom, id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING zoom, x_coor, y_coor
+                """,
+                [batch_size],
+            )
+            tiles = sorted(cursor.fetchall())
+        for zoom, coords in tile_batches(tiles, batch_size):
+            for bucket in buckets:
+                create_mvt_stv(zoom, coords, bucket)
+        if len(tiles) > 0:
+            zooms, x_coors, y_coors = zip(*tiles)
+            bump_layout_versions(
+                """
+                (zoom, x_coor, y_coor) IN (
+                    SELECT * FROM unnest(
+                        %(zooms)s::integer[], %(x_coors)s::integer[],
+                        %(y_coors)s::integer[]
+                    )
                 )
-            ) AS foo
-            WHERE history_date >= to_timestamp(%s)
-        ) AS foo
-        CROSS JOIN api_tilelayout
-        WHERE ST_Intersects(bbox, territory)
-        ORDER BY zoom ASC;
-        """,
-        [timestamp],
-    )
-    print("Total tiles to update", len(tiles))
-    populate_mvt_stv_layer(0, tiles, True)
+                """,
+                {
+                    "zooms": list(zooms),
+                    "x_coors": list(x_coors),
+                    "y_coors": list(y_coors),
+                },
+            )
+    return len(tiles)
+
+
+def update_affected_mvts(buckets=(None,), **options):
+    """Regenerate tiles queued in DirtyTile until the queue is empty"""
+    jobs = options.get("jobs", JOBS)
+    batch_size = options.get("batch_size", BATCH_SIZE)
+    progress = Progress("Update", DirtyTile.objects.count())
+    print("Total tiles to update", progress.total)
+    db.connections.close_all()
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=get_context("fork")) as pool:
+        running = {
+            pool.submit(drain_worker, batch_size, buckets) for _ in range(0, jobs)
+        }
+        while len(running) > 0:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                count = future.result()
+                if count > 0:
+                    progress.update(count)
+                    running.add(pool.submit(drain_worker, batch_size, buckets))
+    progress.report()
 
 
 class Command(BaseCommand):
@@ -165,25 +330,85 @@ class Command(BaseCommand):
         parser.add_argument(
             "--update",
             action="store_true",
-            help="Update STVs",
+            help="Regenerate tiles queued by STV changes",
+        )
+        parser.add_argument(
+            "--timestamp",
+            type=int,
+            help="Previous run, STVs changed since then are fixed on antimeridian",
+            default=0,
+        )
+        parser.add_argument("--jobs", type=int, help="Worker processes", default=JOBS)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Tiles stored by one statement",
+            default=BATCH_SIZE,
+        )
+        parser.add_argument(
+            "--simplify",
+            action="store_true",
+            help="Rebuild precomputed simplified territory before rendering",
+        )
+        parser.add_argument(
+            "--topology",
+            action="store_true",
+            help="Simplify shared borders once per era bucket, implies --date-buckets",
+        )
+        parser.add_argument(
+            "--date-buckets",
+            action="store_true",
+            help="Also generate tiles for every era bucket",
         )
-        parser.add_argument("--timestamp", type=int, help="Previous run", default=0)
 
     def handle(self, *args, **options):
+        pool = {"jobs": options["jobs"], "batch_size": options["batch_size"]}
+        buckets = [None]
+        if options["date_buckets"] or options["topology"]:
+            buckets.extend(stv_date_buckets())
+            print("Era buckets {}".format(len(buckets) - 1))
+
+        if not options["update"]:
+            # Every tile is regenerated, changes made from now on stay queued
+            DirtyTile.objects.all().delete()
+
+        if options["simplify"]:
+            print("Simplifying territory up to zoom", settings.MVT_SIMPLIFIED_ZOOM)
+            update_simplified_territory()
+        if options["topology"]:
+            populate_topology(buckets[1:], **pool)
+
         # Remove tiles with precision greater than zoom
         TileLayout.objects.filter(zoom__gt=ZOOM).delete()
         MVTLayers.objects.filter(zoom__gt=ZOOM).delete()
 
+        # Coverage is computed only for zoom levels which are regenerated,
+        # incremental updates of existing layouts don't scan the whole map
+        coverage, covered_zoom = [(0, 0)], -1
         for zoom in range(0, ZOOM + 1):
             tiles = pow(2, zoom)
             new_layout = populate_tile_layout(zoom, tiles)
-            if not options["update"] or new_layout:
-                print(
-                    "Zoom {0}; Tiles {1}x{1}; Total {2}".format(
-                        zoom, tiles, pow(tiles, 2)
-                    )
+            if options["update"] and not new_layout:
+                continue
+            # Children of covered tiles of the levels skipped so far
+            for level in range(covered_zoom + 1, zoom + 1):
+                coverage = covered_tiles(level, coverage)
+            covered_zoom = zoom
+            print(
+                "Zoom {0}; Tiles {1}x{1}; Total {2}; Covered by STVs {3}".format(
+                    zoom, tiles, pow(tiles, 2), len(coverage)
                 )
-                populate_mvt_stv_layer(zoom, tiles)
+            )
+            print("Removed empty tiles", remove_uncovered_tiles(zoom, coverage))
+            populate_mvt_stv_layer(
+                "Zoom {}".format(zoom),
+                ((zoom, x_coor, y_coor) for x_coor, y_coor in coverage),
+                len(coverage),
+                buckets,
+                **pool,
+            )
+            # Whole level is rewritten, cached tiles of it are outdated
+            bump_layout_versions("zoom = %(zoom)s", {"zoom": zoom})
         if options["update"] and not new_layout:
             fix_antimeridian(options["timestamp"])
-            update_affected_mvts(options["timestamp"])
+            update_affected_mvts(buckets, **pool)
@@ -0,0 +1,373 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import os
+import time
+
+from cacheops import invalidate_model
+from django.conf import settings
+from django.contrib.gis.gdal import DataSource
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.models import SpacetimeVolume, TerritorialEntity
+from api.helpers.mvt import update_simplified_territory
+from api.helpers.te_list import update_te_list_fragments
+from api.helpers.tile_versions import bump_tile_versions
+
+EXTENSIONS = (".geojson", ".json", ".gpkg", ".shp")
+COPY_BATCH = 5000
+
+STAGING_TABLE = """
+    CREATE TEMPORARY TABLE stv_import (
+        row_id SERIAL PRIMARY KEY,
+        source TEXT,
+        entity_id INTEGER,
+        start_date NUMERIC(10, 1),
+        end_date NUMERIC(10, 1),
+        reference TEXT,
+        srid INTEGER,
+        wkb TEXT,
+        territory GEOMETRY,
+        error TEXT
+    ) ON COMMIT DROP
+"""
+
+STAGING_COPY = """
+    COPY stv_import (source, entity_id, start_date, end_date, reference, srid, wkb)
+    FROM STDIN
+"""
+
+# Reproject to EPSG:4326 and turn invalid geometry and collections
+# into valid (Multi)Polygons, same as the stv upload form does
+REPAIR_GEOMETRY = """
+    UPDATE stv_import SET territory = CASE
+        WHEN ST_IsValid(geom) AND GeometryType(geom) IN ('POLYGON', 'MULTIPOLYGON')
+        THEN geom ELSE ST_CollectionExtract(ST_MakeValid(geom), 3)
+    END
+    FROM (
+        SELECT row_id AS id, ST_Transform(
+            ST_Force2D(ST_SetSRID(ST_GeomFromWKB(decode(wkb, 'hex')), srid)), 4326
+        ) AS geom
+        FROM stv_import WHERE wkb IS NOT NULL
+    ) AS parsed
+    WHERE parsed.id = stv_import.row_id
+"""
+
+# Rows are rejected by the first failing check
+IMPORT_CHECKS = (
+    (
+        "Unknown entity",
+        """
+        NOT EXISTS (
+            SELECT FROM api_territorialentity WHERE id = stv_import.entity_id
+        )
+        """,
+    ),
+    (
+        "Use JDN for start_date and end_date",
+        "start_date IS NULL OR end_date IS NULL OR start_date >= end_date",
+    ),
+    ("Invalid geometry", "territory IS NULL OR ST_IsEmpty(territory)"),
+    (
+        "Not bounded by EPSG:4326 coordinates",
+        "NOT ST_Within(territory, ST_MakeEnvelope(-180, -90, 180, 90, 4326))",
+    ),
+    (
+        "Overlaps an existing STV of the entity",
+        """
+        EXISTS (
+            SELECT FROM api_spacetimevolume
+            WHERE entity_id = stv_import.entity_id
+            AND during && numrange(stv_import.start_date, stv_import.end_date, '[]')
+        )
+        """,
+    ),
+)
+
+# Checked after IMPORT_CHECKS, see reject_overlapping_rows
+OVERLAPS_EARLIER_ROW = "Overlaps an earlier imported STV of the entity"
+
+# visual_center follows SpacetimeVolume.calculate_center:
+# centroid of the largest part, or a point on its surface
+INSERT_STVS = """
+    INSERT INTO api_spacetimevolume (
+        start_date, end_date, territory, entity_id, "references",
+        visual_center, during
+    )
+    SELECT
+        start_date, end_date, territory, entity_id,
+        string_to_array(reference, E'\\n'),
+        CASE WHEN ST_Intersects(part, ST_Centroid(part))
+            THEN ST_Centroid(part) ELSE ST_PointOnSurface(part) END,
+        numrange(start_date, end_date, '[]')
+    FROM stv_import, LATERAL (
+        SELECT geom AS part FROM ST_Dump(territory) ORDER BY ST_Area(geom) DESC LIMIT 1
+    ) AS largest
+    WHERE error IS NULL
+    ORDER BY row_id
+    RETURNING id, entity_id
+"""
+
+# Signals are bypassed, history rows keep territorial-entities/changes in sync
+UPDATE_TE_BOUNDS = """
+    UPDATE api_territorialentity SET
+        inception_date = LEAST(inception_date, bounds.start_date),
+        dissolution_date = GREATEST(dissolution_date, bounds.end_date)
+    FROM (
+        SELECT entity_id, MIN(start_date) AS start_date, MAX(end_date) AS end_date
+        FROM api_spacetimevolume WHERE id = ANY(%(ids)s)
+        GROUP BY entity_id
+    ) AS bounds
+    WHERE api_territorialentity.id = bounds.entity_id AND (
+        inception_date IS DISTINCT FROM LEAST(inception_date, bounds.start_date)
+        OR dissolution_date IS DISTINCT FROM GREATEST(dissolution_date, bounds.end_date)
+    )
+    RETURNING api_territorialentity.id
+"""
+
+# Signals are bypassed, history is written by the last statement
+# of the import, so history_date is close to commit time
+INSERT_HISTORY = """
+    WITH stv_history AS (
+        INSERT INTO api_historicalspacetimevolume (
+            id, start_date, end_date, territory, entity_id, "references",
+            visual_center, during, history_date, history_type
+        )
+        SELECT
+            id, start_date, end_date, territory, entity_id, "references",
+            visual_center, during, clock_timestamp(), '+'
+        FROM api_spacetimevolume WHERE id = ANY(%(ids)s)
+    )
+    INSERT INTO api_historicalterritorialentity (
+        id, wikidata_id, label, color_id, admin_level,
+        inception_date, dissolution_date, history_date, history_type
+    )
+    SELECT
+        id, wikidata_id, label, color_id, admin_level,
+        inception_date, dissolution_date, clock_timestamp(), '~'
+    FROM api_territorialentity WHERE id = ANY(%(entities)s)
+"""
+
+
+def reject_overlapping_rows(cursor):
+    """
+    Reject rows overlapping an earlier accepted row of the same entity.
+    Rows are accepted one by one in import order, so a row rejected for
+    overlapping an earlier one doesn't reject the rows after it.
+    """
+    cursor.execute(
+        """
+        SELECT row_id, entity_id, start_date, end_date
+        FROM stv_import WHERE error IS NULL ORDER BY row_id
+        """
+    )
+    accepted = {}
+    rejected = []
+    for row_id, entity, start_date, end_date in cursor.fetchall():
+        ranges = accepted.setdefault(entity, [])
+        # Ranges include both bounds, same as SpacetimeVolume.during
+        if any(start <= end_date and start_date <= end for start, end in ranges):
+            rejected.append(row_id)
+        else:
+            ranges.append((start_date, end_date))
+    cursor.execute(
+        "UPDATE stv_import SET error = %(error)s WHERE row_id = ANY(%(ids)s)",
+        {"error": OVERLAPS_EARLIER_ROW, "ids": rejected},
+    )
+
+
+def import_files(path):
+    """
+    Files with supported extensions in path, directories are walked recursively
+    """
+    if not os.path.isdir(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def copy_value(value):
+    """
+    Format value for COPY text format
+    """
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def parse_number(value, kind=float):
+    """
+    Convert attribute value, None if it's missing or malformed
+    """
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def feature_rows(path, fields, entity=None):
+    """
+    Staging rows of all features in all layers of the file
+    """
+    for layer in DataSource(path):
+        srs = layer.srs
+        if srs is not None:
+            srs.identify_epsg()
+        srid = 4326 if srs is None else srs.srid
+        for feature in layer:
+            attributes = {name: feature.get(name) for name in feature.fields}
+            references = attributes.get(fields["references"])
+            if isinstance(references, (list, tuple)):
+                references = "\n".join(str(i) for i in references)
+            geom = feature.geom
+            if srid is None:
+                # Projection without an EPSG code, reproject with GDAL
+                geom.transform(4326)
+            yield (
+                "{}:{}".format(path, feature.fid),
+                entity or parse_number(attributes.get(fields["entity"]), int),
+                parse_number(attributes.get(fields["start_date"])),
+                parse_number(attributes.get(fields["end_date"])),
+                references or None,
+                srid or 4326,
+                geom.hex,
+            )
+
+
+def copy_rows(cursor, rows):
+    """
+    Stream rows into the staging table in batches
+    """
+    count = 0
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(copy_value(value) for value in row))
+        buffer.write("\n")
+        count += 1
+        if count % COPY_BATCH == 0:
+            buffer.seek(0)
+            cursor.copy_expert(STAGING_COPY, buffer)
+            buffer = io.StringIO()
+    buffer.seek(0)
+    cursor.copy_expert(STAGING_COPY, buffer)
+    return count
+
+
+class Command(BaseCommand):
+    """
+    Bulk import of STVs from GeoJSON, GeoPackage and shapefiles.
+    Features are copied into a staging table, validated and repaired
+    in SQL and inserted with a few set-based statements.
+    """
+
+    help = "Import STVs from a GeoJSON, GeoPackage or shapefile file or directory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File or directory to import")
+        parser.add_argument(
+            "--entity", type=int, help="TerritorialEntity of all imported STVs"
+        )
+        parser.add_argument("--entity-field", default="entity")
+        parser.add_argument("--start-field", default="start_date")
+        parser.add_argument("--end-field", default="end_date")
+        parser.add_argument("--references-field", default="references")
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Validate without importing"
+        )
+
+    def handle(self, *args, **options):
+        fields = {
+            "entity": options["entity_field"],
+            "start_date": options["start_field"],
+            "end_date": options["end_field"],
+            "references": options["references_field"],
+        }
+        started = time.monotonic()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(STAGING_TABLE)
+                loaded = 0
+                for path in import_files(options["path"]):
+                    loaded += copy_rows(
+                        cursor, feature_rows(path, fields, options["entity"])
+                    )
+                cursor.execute("ANALYZE stv_import")
+                cursor.execute(REPAIR_GEOMETRY)
+                for error, condition in IMPORT_CHECKS:
+                    cursor.execute(
+                        "UPDATE stv_import SET error = %(error)s "
+                        "WHERE error IS NULL AND ({})".format(condition),  # nosec
+                        {"error": error},
+                    )
+                reject_overlapping_rows(cursor)
+                cursor.execute(
+                    """
+                    SELECT error, COUNT(*), (array_agg(source ORDER BY row_id))[1:5]
+                    FROM stv_import WHERE error IS NOT NULL
+                    GROUP BY error ORDER BY error
+                    """
+                )
+                for error, count, sources in cursor.fetchall():
+                    print(
+                        "Rejected {}: {} ({})".format(count, error, ", ".join(sources))
+                    )
+
+                if options["dry_run"]:
+                    transaction.set_rollback(True)
+                    print("Validated {} features".format(loaded))
+                    return
+
+                cursor.execute(INSERT_STVS)
+                rows = cursor.fetchall()
+                ids = [row[0] for row in rows]
+                cursor.execute(UPDATE_TE_BOUNDS, {"ids": ids})
+                bounded = [row[0] for row in cursor.fetchall()]
+
+            if ids:
+                # Derived data otherwise maintained by SpacetimeVolume signals
+                update_simplified_territory(ids)
+                bump_tile_versions(
+                    "api_spacetimevolume.id = ANY(%(ids)s)", {"ids": ids}
+                )
+                update_te_list_fragments(sorted({row[1] for row in rows}))
+                with connection.cursor() as cursor:
+                    cursor.execute(INSERT_HISTORY, {"ids": ids, "entities": bounded})
+        if ids and "cacheops" in settings.INSTALLED_APPS:
+            # Rows are written in SQL, cacheops doesn't see them
+            invalidate_model(SpacetimeVolume)
+            invalidate_model(TerritorialEntity)
+        print(
+            "Imported {} of {} STVs in {:.1f}s".format(
+                len(ids), loaded, time.monotonic() - started
+            )
+        )
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.5 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0024_alter_historicalcacheddata_options_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tilelayout",
+            name="version",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            "CREATE SEQUENCE api_tilelayout_version_seq;",
+            reverse_sql="DROP SEQUENCE IF EXISTS api_tilelayout_version_seq;",
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.5 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0025_tilelayout_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DirtyTile",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("zoom", models.PositiveIntegerField()),
+                ("x_coor", models.PositiveIntegerField()),
+                ("y_coor", models.PositiveIntegerField()),
+            ],
+            options={
+                "unique_together": {("zoom", "x_coor", "y_coor")},
+            },
+        ),
+    ]
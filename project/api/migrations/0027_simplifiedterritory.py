@@ -0,0 +1,73 @@
+# Generated by Django 4.1.5 on 2026-10-18 13:05
+
+from django.conf import settings
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Simplified territory of existing STVs with tolerances of
+# api.helpers.mvt.mvt_geom_simplification as of this migration
+SIMPLIFY_TERRITORY = """
+    INSERT INTO api_simplifiedterritory (stv_id, zoom, territory)
+    SELECT stv_id, zoom, territory FROM (
+        SELECT
+            id AS stv_id, zoom
+            , ST_SnapToGrid(
+                ST_Transform(ST_Simplify(territory, tolerance), 3857), 1
+            ) AS territory
+        FROM api_spacetimevolume
+        CROSS JOIN (
+            SELECT zoom, (360.0 / 2 ^ zoom) / 4096.0
+                * CASE WHEN zoom > 5 THEN 1 ELSE 2.2 - 0.2 * zoom END AS tolerance
+            FROM generate_series(0, %(max_zoom)s) AS zoom
+        ) AS zooms
+    ) AS simplified
+    WHERE territory IS NOT NULL AND NOT ST_IsEmpty(territory)
+"""
+
+
+def simplify_territory(apps, schema_editor):  # pylint: disable=W0613
+    """Precompute simplified territory for existing STVs"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(SIMPLIFY_TERRITORY, {"max_zoom": settings.MVT_SIMPLIFIED_ZOOM})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0026_dirtytile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimplifiedTerritory",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("zoom", models.PositiveIntegerField()),
+                (
+                    "territory",
+                    django.contrib.gis.db.models.fields.GeometryField(srid=3857),
+                ),
+                (
+                    "stv",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="simplified",
+                        to="api.spacetimevolume",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("stv", "zoom")},
+            },
+        ),
+        migrations.RunPython(simplify_territory, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.5 on 2026-10-18 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0027_simplifiedterritory"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="simplifiedterritory",
+            name="bucket",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name="simplifiedterritory",
+            unique_together={("stv", "zoom", "bucket")},
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.1.5 on 2026-10-18 15:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Fragments of existing entities, shape of territorial-entities/list elements
+# as of this migration
+BUILD_FRAGMENTS = """
+    INSERT INTO api_telistfragment (entity_id, fragment)
+    SELECT id, row_to_json(foo)::text FROM (
+        SELECT id, wikidata_id, color_id AS color, admin_level,
+            dissolution_date, inception_date, label,
+            COALESCE(stvs, '[]'::json) AS stvs,
+            COALESCE(json_array_length(stvs), 0) AS stv_count
+        FROM api_territorialentity
+        LEFT JOIN LATERAL (
+            SELECT json_agg(row_to_json(foo)) AS stvs FROM (
+                SELECT
+                    entity_id as entity,
+                    id,
+                    start_date,
+                    end_date,
+                    ST_AsGeoJSON(visual_center)::json AS visual_center,
+                    "references"
+                FROM api_spacetimevolume
+                WHERE entity_id = api_territorialentity.id
+            ) as foo
+        ) AS stvs ON TRUE
+    ) AS foo;
+    SELECT nextval('api_telist_version_seq');
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0028_simplifiedterritory_bucket"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TEListSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.BigIntegerField()),
+                ("gzip", models.BinaryField()),
+                ("brotli", models.BinaryField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TEListFragment",
+            fields=[
+                (
+                    "entity",
+                    models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to="api.territorialentity",
+                    ),
+                ),
+                ("fragment", models.TextField()),
+            ],
+        ),
+        migrations.RunSQL(
+            "CREATE SEQUENCE api_telist_version_seq;",
+            reverse_sql="DROP SEQUENCE IF EXISTS api_telist_version_seq;",
+        ),
+        migrations.RunSQL(BUILD_FRAGMENTS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.5 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0029_telistfragment_telistsnapshot"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="territorialentity",
+            index=models.Index(fields=["admin_level"], name="api_te_admin_level_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="spacetimevolume",
+            index=models.Index(
+                fields=["start_date", "end_date"], name="api_stv_dates_idx"
+            ),
+        ),
+    ]
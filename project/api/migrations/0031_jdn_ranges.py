@@ -0,0 +1,118 @@
+# Generated by Django 4.1.5 on 2026-10-18 17:25
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+
+# Backfill can't build a range of reversed dates
+CHECK_RANGES = """
+    DO $$
+    DECLARE
+        reversed TEXT;
+    BEGIN
+        SELECT string_agg(id::text, ', ' ORDER BY id) INTO reversed
+        FROM {table} WHERE {start} > {end};
+        IF reversed IS NOT NULL THEN
+            RAISE EXCEPTION 'Fix {start} after {end} of {table} ids: %', reversed;
+        END IF;
+    END
+    $$;
+"""
+
+RANGE_TRIGGER = """
+    CREATE FUNCTION {table}_during() RETURNS trigger AS $$
+    BEGIN
+        NEW.during := numrange(NEW.{start}, NEW.{end}, '[]');
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    CREATE TRIGGER {table}_during BEFORE INSERT OR UPDATE ON {table}
+    FOR EACH ROW EXECUTE PROCEDURE {table}_during();
+    UPDATE {table} SET during = numrange({start}, {end}, '[]');
+"""
+
+DROP_RANGE_TRIGGER = """
+    DROP TRIGGER IF EXISTS {table}_during ON {table};
+    DROP FUNCTION IF EXISTS {table}_during();
+"""
+
+RANGE_TABLES = [
+    {"table": "api_spacetimevolume", "start": "start_date", "end": "end_date"},
+    {"table": "api_politicalrelation", "start": "start_date", "end": "end_date"},
+    {"table": "api_city", "start": "inception_date", "end": "dissolution_date"},
+]
+
+
+def range_field():
+    return django.contrib.postgres.fields.ranges.DecimalRangeField(
+        blank=True, editable=False, null=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0030_stv_te_indexes"),
+    ]
+
+    operations = (
+        [
+            migrations.RunSQL(CHECK_RANGES.format(**table), migrations.RunSQL.noop)
+            for table in RANGE_TABLES
+        ]
+        + [
+            BtreeGistExtension(),
+            migrations.AddField(
+                model_name="spacetimevolume", name="during", field=range_field()
+            ),
+            migrations.AddField(
+                model_name="historicalspacetimevolume",
+                name="during",
+                field=range_field(),
+            ),
+            migrations.AddField(
+                model_name="politicalrelation", name="during", field=range_field()
+            ),
+            migrations.AddField(
+                model_name="historicalpoliticalrelation",
+                name="during",
+                field=range_field(),
+            ),
+            migrations.AddField(model_name="city", name="during", field=range_field()),
+            migrations.AddField(
+                model_name="historicalcity", name="during", field=range_field()
+            ),
+        ]
+        + [
+            migrations.RunSQL(
+                RANGE_TRIGGER.format(**table),
+                reverse_sql=DROP_RANGE_TRIGGER.format(**table),
+            )
+            for table in RANGE_TABLES
+        ]
+        + [
+            migrations.RemoveIndex(
+                model_name="spacetimevolume",
+                name="api_stv_dates_idx",
+            ),
+            migrations.AddIndex(
+                model_name="spacetimevolume",
+                index=django.contrib.postgres.indexes.GistIndex(
+                    fields=["during", "territory"], name="api_stv_during_territory_idx"
+                ),
+            ),
+            migrations.AddIndex(
+                model_name="politicalrelation",
+                index=django.contrib.postgres.indexes.GistIndex(
+                    fields=["child", "during"], name="api_pr_child_during_idx"
+                ),
+            ),
+            migrations.AddIndex(
+                model_name="city",
+                index=django.contrib.postgres.indexes.GistIndex(
+                    fields=["during", "location"], name="api_city_during_location_idx"
+                ),
+            ),
+        ]
+    )
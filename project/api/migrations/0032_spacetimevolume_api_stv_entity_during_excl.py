@@ -0,0 +1,41 @@
+# Generated by Django 4.1.5 on 2026-10-18 18:10
+
+import django.contrib.postgres.constraints
+from django.db import migrations
+
+# Constraint can't be added while an entity has overlapping STVs
+CHECK_OVERLAPS = """
+    DO $$
+    DECLARE
+        overlaps TEXT;
+    BEGIN
+        SELECT string_agg(a.id || ' and ' || b.id, ', ' ORDER BY a.id, b.id)
+        INTO overlaps
+        FROM api_spacetimevolume AS a
+        JOIN api_spacetimevolume AS b
+        ON a.entity_id = b.entity_id AND a.id < b.id AND a.during && b.during;
+        IF overlaps IS NOT NULL THEN
+            RAISE EXCEPTION 'Fix overlapping timeframes of STVs %', overlaps;
+        END IF;
+    END
+    $$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0031_jdn_ranges"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CHECK_OVERLAPS, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name="spacetimevolume",
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(
+                expressions=[("entity", "="), ("during", "&&")],
+                name="api_stv_entity_during_excl",
+                violation_error_message="Another STV for this entity exists in the same timeframe",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.1.5 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0032_spacetimevolume_api_stv_entity_during_excl"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StagedTerritory",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ewkb", models.BinaryField()),
+                ("checksum", models.CharField(max_length=64)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
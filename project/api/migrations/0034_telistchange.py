@@ -0,0 +1,58 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0033_stagedterritory"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="telistsnapshot",
+            name="sync_cursor",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        # Snapshots without sync cursor are rebuilt on request
+        migrations.RunSQL("DELETE FROM api_telistsnapshot", migrations.RunSQL.noop),
+        migrations.CreateModel(
+            name="TEListChange",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("txid", models.BigIntegerField(db_index=True)),
+                (
+                    "entity",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="api.territorialentity",
+                    ),
+                ),
+                (
+                    "stv",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="api.spacetimevolume",
+                    ),
+                ),
+            ],
+        ),
+    ]
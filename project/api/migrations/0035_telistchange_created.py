@@ -0,0 +1,39 @@
+# Generated by Django 4.1.5 on 2026-10-18 21:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0034_telistchange"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="telistchange",
+            name="created",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        # Entities were logged on every fragment rebuild
+        migrations.RunSQL(
+            """
+            DELETE FROM api_telistchange AS duplicate
+            USING api_telistchange AS logged
+            WHERE duplicate.id > logged.id AND duplicate.txid = logged.txid
+            AND (
+                duplicate.entity_id = logged.entity_id
+                OR duplicate.stv_id = logged.stv_id
+            )
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterUniqueTogether(
+            name="telistchange",
+            unique_together={("stv", "txid"), ("entity", "txid")},
+        ),
+    ]
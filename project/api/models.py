@@ -21,13 +21,27 @@ from requests import get
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models
-from django.contrib.postgres.fields import ArrayField, HStoreField
-from django.db import connection
-from django.db.models.signals import post_save, post_delete
+from django.contrib.postgres.fields import ArrayField, DecimalRangeField, HStoreField
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import RangeOperators
+from django.contrib.postgres.indexes import GistIndex
+from django.db import connection, transaction, IntegrityError
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
 from django.dispatch import receiver
 from ordered_model.models import OrderedModel
+from psycopg2.extras import NumericRange
 from simple_history.models import HistoricalRecords
 from colorfield.fields import ColorField
+from api.helpers.mvt import update_simplified_territory
+from api.helpers.tile_versions import bump_tile_versions
+from api.helpers.te_list import log_deleted_stvs, update_te_list_fragments
+
+
+def jdn_range(start_date, end_date):
+    """
+    Inclusive range of JDN, None stands for unbounded side
+    """
+    return NumericRange(start_date, end_date, "[]")
 
 
 class TileLayout(models.Model):
@@ -37,6 +51,19 @@ class TileLayout(models.Model):
     x_coor = models.PositiveIntegerField()
     y_coor = models.PositiveIntegerField()
     bbox = models.GeometryField()
+    # Bumped when any STV intersecting bbox changes, see bump_tile_versions
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("zoom", "x_coor", "y_coor")
+
+
+class DirtyTile(models.Model):
+    """Queue of TileLayout cells waiting for MVT regeneration"""
+
+    zoom = models.PositiveIntegerField()
+    x_coor = models.PositiveIntegerField()
+    y_coor = models.PositiveIntegerField()
 
     class Meta:
         unique_together = ("zoom", "x_coor", "y_coor")
@@ -140,6 +167,9 @@ class TerritorialEntity(models.Model):
     )
     history = HistoricalRecords()
 
+    class Meta:
+        indexes = [models.Index(fields=["admin_level"], name="api_te_admin_level_idx")]
+
     def clean(self, *args, **kwargs):  # pylint: disable=W0221
         if not self.inception_date is None and not self.dissolution_date is None:
             if self.inception_date > self.dissolution_date:
@@ -183,8 +213,15 @@ class PoliticalRelation(models.Model):
     control_type = models.PositiveIntegerField(choices=CONTROL_TYPES)
 
     user_created = models.BooleanField(default=False)
+    # Derived from start_date and end_date on save and by trigger
+    during = DecimalRangeField(blank=True, null=True, editable=False)
     history = HistoricalRecords()
 
+    class Meta:
+        indexes = [
+            GistIndex(fields=["child", "during"], name="api_pr_child_during_idx")
+        ]
+
     def clean(self, *args, **kwargs):  # pylint: disable=W0221
         if self.start_date > self.end_date:
             raise ValidationError("Start date cannot be later than end date")
@@ -198,6 +235,7 @@ class PoliticalRelation(models.Model):
 
     def save(self, *args, **kwargs):  # pylint: disable=W0221
         self.full_clean()
+        self.during = jdn_range(self.start_date, self.end_date)
         super(PoliticalRelation, self).save(*args, **kwargs)
 
 
@@ -278,8 +316,17 @@ class City(models.Model):
     dissolution_date = models.DecimalField(
         decimal_places=1, max_digits=10, blank=True, null=True
     )
+    # Derived from inception_date and dissolution_date on save and by trigger
+    during = DecimalRangeField(blank=True, null=True, editable=False)
     history = HistoricalRecords()
 
+    class Meta:
+        indexes = [
+            GistIndex(
+                fields=["during", "location"], name="api_city_during_location_idx"
+            )
+        ]
+
     def clean(self, *args, **kwargs):  # pylint: disable=W0221
         if self.dissolution_date and self.inception_date > self.dissolution_date:
             raise ValidationError(
@@ -289,9 +336,14 @@ class City(models.Model):
 
     def save(self, *args, **kwargs):  # pylint: disable=W0221
         self.full_clean()
+        self.during = jdn_range(self.inception_date, self.dissolution_date)
         super(City, self).save(*args, **kwargs)
 
 
+STV_TIMEFRAME_CONSTRAINT = "api_stv_entity_during_excl"
+STV_TIMEFRAME_ERROR = "Another STV for this entity exists in the same timeframe"
+
+
 class SpacetimeVolume(models.Model):
     """
     Maps a set of Territories to a TerritorialEntity at a specific time
@@ -306,8 +358,27 @@ class SpacetimeVolume(models.Model):
     references = ArrayField(models.TextField(max_length=500), blank=True, null=True)
     visual_center = models.PointField(blank=True, null=True)
     related_events = models.ManyToManyField(CachedData, blank=True)
+    # Derived from start_date and end_date on save and by trigger
+    during = DecimalRangeField(blank=True, null=True, editable=False)
     history = HistoricalRecords()
 
+    class Meta:
+        indexes = [
+            GistIndex(
+                fields=["during", "territory"], name="api_stv_during_territory_idx"
+            )
+        ]
+        constraints = [
+            ExclusionConstraint(
+                name=STV_TIMEFRAME_CONSTRAINT,
+                expressions=[
+                    ("entity", RangeOperators.EQUAL),
+                    ("during", RangeOperators.OVERLAPS),
+                ],
+                violation_error_message=STV_TIMEFRAME_ERROR,
+            )
+        ]
+
     def calculate_center(self):
         """
         Calculate and set the visual_center field
@@ -339,18 +410,13 @@ class SpacetimeVolume(models.Model):
             )
 
     def clean(self, *args, **kwargs):  # pylint: disable=W0221
+        # Reversed dates are not a valid range for during
         if (
-            SpacetimeVolume.objects.filter(
-                start_date__lte=self.end_date,
-                end_date__gte=self.start_date,
-                entity=self.entity,
-            )
-            .exclude(pk=self.pk)
-            .exists()
+            self.start_date is not None
+            and self.end_date is not None
+            and self.start_date > self.end_date
         ):
-            raise ValidationError(
-                "Another STV for this entity exists in the same timeframe"
-            )
+            raise ValidationError("Start date cannot be later than end date")
 
         if not self.territory is None:
             if (
@@ -364,10 +430,110 @@ class SpacetimeVolume(models.Model):
         super(SpacetimeVolume, self).clean(*args, **kwargs)
 
     def save(self, *args, **kwargs):  # pylint: disable=W0221
-        self.full_clean()
-        super(SpacetimeVolume, self).save(*args, **kwargs)
+        # Overlapping timeframes are rejected by the exclusion constraint
+        self.full_clean(validate_constraints=False)
+        self.during = jdn_range(self.start_date, self.end_date)
+        try:
+            with transaction.atomic():
+                super(SpacetimeVolume, self).save(*args, **kwargs)
+        except IntegrityError as error:
+            diag = getattr(error.__cause__, "diag", None)
+            if getattr(diag, "constraint_name", None) == STV_TIMEFRAME_CONSTRAINT:
+                raise ValidationError(STV_TIMEFRAME_ERROR)
+            raise
         if not self.visual_center:
             self.calculate_center()
+            update_te_list_fragments([self.entity_id])
+
+
+class SimplifiedTerritory(models.Model):
+    """
+    STV territory simplified for a zoom level and transformed to EPSG:3857
+    Maintained on STV save, read by tile queries instead of full territory.
+    Rows with bucket hold topology-preserving geometry of the era bucket.
+    """
+
+    stv = models.ForeignKey(
+        SpacetimeVolume, on_delete=models.CASCADE, related_name="simplified"
+    )
+    zoom = models.PositiveIntegerField()
+    bucket = models.IntegerField(blank=True, null=True)
+    territory = models.GeometryField(srid=3857)
+
+    class Meta:
+        unique_together = ("stv", "zoom", "bucket")
+
+
+class TEListFragment(models.Model):
+    """
+    Element of territorial-entities/list for one entity
+    Maintained on entity and STV changes, rows of deleted entities are removed
+    by update_te_list_fragments.
+    """
+
+    entity = models.OneToOneField(
+        TerritorialEntity,
+        primary_key=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    fragment = models.TextField()
+
+
+class TEListSnapshot(models.Model):
+    """
+    Compressed territorial-entities/list document built from fragments
+    """
+
+    version = models.BigIntegerField()
+    gzip = models.BinaryField()
+    brotli = models.BinaryField(blank=True, null=True)
+    # Changes of transactions not visible to the build have txid >= sync_cursor
+    sync_cursor = models.BigIntegerField(blank=True, null=True)
+
+
+class TEListChange(models.Model):
+    """
+    Entity whose list fragment changed or STV deleted by transaction txid
+    Read by territorial-entities/changes, ordered by commit through txid.
+    Rows are deleted by clean_te_changes once expired, a row without entity
+    and STV marks the txid below which changes are no longer complete.
+    """
+
+    entity = models.ForeignKey(
+        TerritorialEntity,
+        blank=True,
+        null=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    stv = models.ForeignKey(
+        "SpacetimeVolume",
+        blank=True,
+        null=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    txid = models.BigIntegerField(db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (("entity", "txid"), ("stv", "txid"))
+
+
+class StagedTerritory(models.Model):
+    """
+    Uploaded STV territory waiting for add_new_stv task
+    Task message refers to it by id and checksum, rows are deleted
+    by the task or by clean_staged_territories once expired.
+    """
+
+    ewkb = models.BinaryField()
+    checksum = models.CharField(max_length=64)
+    created = models.DateTimeField(auto_now_add=True)
 
 
 class Narrative(models.Model):
@@ -506,3 +672,101 @@ def te_bounds_delete(sender, instance, **kwargs):  # pylint: disable=W0613
         else:
             instance.entity.dissolution_date = None
         instance.entity.save()
+
+
+@receiver(pre_save, sender=SpacetimeVolume)
+@receiver(post_save, sender=SpacetimeVolume)
+@receiver(pre_delete, sender=SpacetimeVolume)
+def stv_tiles_bump(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Bumps versions of tiles covered by the STV.
+    Old territory is covered before save, new territory after save.
+    """
+    if instance.pk is not None:
+        bump_tile_versions("api_spacetimevolume.id = %(id)s", {"id": instance.pk})
+
+
+@receiver(post_save, sender=SpacetimeVolume)
+def stv_simplify(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Precomputes simplified territory for tile zoom levels
+    """
+    update_simplified_territory([instance.pk])
+
+
+@receiver(pre_save, sender=TerritorialEntity)
+def te_tiles_bump(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Bumps versions of tiles covered by the entity's STVs
+    when properties rendered in tiles are changed.
+    """
+    if instance.pk is None:
+        return
+    if TerritorialEntity.objects.filter(
+        pk=instance.pk,
+        wikidata_id=instance.wikidata_id,
+        color_id=instance.color_id,
+        admin_level=instance.admin_level,
+    ).exists():
+        return
+    bump_tile_versions("api_spacetimevolume.entity_id = %(id)s", {"id": instance.pk})
+
+
+@receiver(pre_save, sender=MapColorScheme)
+def color_tiles_bump(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Bumps versions of tiles covered by STVs using the changed color.
+    """
+    if instance.pk is None:
+        return
+    if MapColorScheme.objects.filter(pk=instance.pk, color=instance.color).exists():
+        return
+    bump_tile_versions(
+        """
+        api_spacetimevolume.entity_id IN (
+            SELECT id FROM api_territorialentity WHERE color_id = %(id)s
+        )
+        """,
+        {"id": instance.pk},
+    )
+
+
+@receiver(pre_save, sender=SpacetimeVolume)
+def stv_previous_entity(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Remembers the entity of the STV, it's list fragment changes
+    when the STV is moved to another entity.
+    """
+    instance.previous_entity_id = (
+        SpacetimeVolume.objects.filter(pk=instance.pk)
+        .values_list("entity_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=SpacetimeVolume)
+@receiver(post_delete, sender=SpacetimeVolume)
+def stv_te_list(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Updates territorial-entities/list fragments of the STV's entities
+    """
+    entities = {instance.entity_id, getattr(instance, "previous_entity_id", None)}
+    entities.discard(None)
+    update_te_list_fragments(sorted(entities))
+
+
+@receiver(post_delete, sender=SpacetimeVolume)
+def stv_deleted_log(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Reports the deleted STV to territorial-entities/changes
+    """
+    log_deleted_stvs([instance.pk])
+
+
+@receiver(post_save, sender=TerritorialEntity)
+@receiver(post_delete, sender=TerritorialEntity)
+def te_list_update(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Updates territorial-entities/list fragment of the entity
+    """
+    update_te_list_fragments([instance.pk])
@@ -0,0 +1,59 @@
+"""
+Chron.
+Copyright (C) 2018 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination, enabled by ?page_size= so complete lists stay available.
+    Ordering of the viewset's queryset is used for the cursor, id otherwise.
+    Primary key is appended when no ordering field is unique, so rows with
+    equal values keep their order between pages.
+    """
+
+    page_size = None
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = "id"
+
+    def get_ordering(self, request, queryset, view):
+        if not queryset.query.order_by:
+            return (self.ordering,)
+        ordering = tuple(queryset.query.order_by)
+        if any(is_unique(queryset.model, field) for field in ordering):
+            return ordering
+        pk_name = queryset.model._meta.pk.name  # pylint: disable=W0212
+        if str(ordering[0]).startswith("-"):
+            return ordering + ("-" + pk_name,)
+        return ordering + (pk_name,)
+
+
+def is_unique(model, field):
+    """Ordering field is a unique column of the model"""
+    if not isinstance(field, str):
+        return False
+    name = field.lstrip("-")
+    if name == "pk":
+        return True
+    try:
+        return model._meta.get_field(name).unique  # pylint: disable=W0212
+    except FieldDoesNotExist:
+        return False
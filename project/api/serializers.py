@@ -17,7 +17,7 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from django.db.models import Count, Case, When
+from django.db.models import Count, Max, Min, Q
 from jdcal import jd2gcal
 from rest_framework.serializers import (
     ModelSerializer,
@@ -44,7 +44,32 @@ from .models import (
 )
 
 
-class MapColorSchemeSerializer(ModelSerializer):
+def requested_fields(request):
+    """
+    Field names listed in ?fields= of GET request, None if not provided
+    """
+    if request is None or request.method != "GET":
+        return None
+    fields = request.query_params.get("fields")
+    if not fields:
+        return None
+    return {name.strip() for name in fields.split(",")}
+
+
+class SparseFieldsMixin:
+    """
+    Limits serialized fields to those listed in ?fields=
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(kwargs.get("context", {}).get("request"))
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+class MapColorSchemeSerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the MapColorScheme model
     """
@@ -54,7 +79,7 @@ class MapColorSchemeSerializer(ModelSerializer):
         fields = "__all__"
 
 
-class NarrativeVoteSerializer(ModelSerializer):
+class NarrativeVoteSerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes User votes for Narratives
     """
@@ -77,7 +102,7 @@ class NarrativeVoteSerializer(ModelSerializer):
         fields = "__all__"
 
 
-class ProfileSerializer(ModelSerializer):
+class ProfileSerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the Profile model
     """
@@ -94,10 +119,10 @@ class SpacetimeVolumeSerializerNoTerritory(ModelSerializer):
 
     class Meta:
         model = SpacetimeVolume
-        exclude = ("territory",)
+        exclude = ("territory", "during")
 
 
-class TerritorialEntitySerializer(ModelSerializer):
+class TerritorialEntitySerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the TerritorialEntity model
     """
@@ -110,17 +135,17 @@ class TerritorialEntitySerializer(ModelSerializer):
         fields = "__all__"
 
 
-class PoliticalRelationSerializer(ModelSerializer):
+class PoliticalRelationSerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the PoliticalRelation model
     """
 
     class Meta:
         model = PoliticalRelation
-        fields = "__all__"
+        exclude = ("during",)
 
 
-class CachedDataSerializer(ModelSerializer):
+class CachedDataSerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the CachedData model
     """
@@ -155,7 +180,7 @@ class SymbolFeatureSerializer(GeoFeatureModelSerializer):
         return attrs
 
 
-class SymbolSerializer(ModelSerializer):
+class SymbolSerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the Symbol model
     """
@@ -165,27 +190,34 @@ class SymbolSerializer(ModelSerializer):
         fields = ("id", "name", "narrations", "features")
 
 
-class CitySerializer(ModelSerializer):
+class CitySerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the City model
     """
 
     class Meta:
         model = City
-        fields = "__all__"
+        exclude = ("during",)
 
 
-class SpacetimeVolumeSerializer(ModelSerializer):
+class SpacetimeVolumeSerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the SpacetimeVolume model
     """
 
     class Meta:
         model = SpacetimeVolume
-        fields = "__all__"
+        exclude = ("during",)
 
+    def to_representation(self, instance):
+        # Territory simplified by SpacetimeVolumeViewSet on request
+        simplified = getattr(instance, "simplified_territory", None)
+        if simplified is not None:
+            instance.territory = simplified
+        return super().to_representation(instance)
 
-class MapSettingsSerializer(ModelSerializer):
+
+class MapSettingsSerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the MapSettings model
     """
@@ -195,7 +227,7 @@ class MapSettingsSerializer(ModelSerializer):
         fields = "__all__"
 
 
-class NarrationSerializer(ModelSerializer):
+class NarrationSerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the Narration model
     """
@@ -213,9 +245,37 @@ class NarrationSerializer(ModelSerializer):
         fields = "__all__"
 
 
-class NarrativeSerializer(ModelSerializer):
+def annotate_narratives(queryset):
+    """
+    Annotates Narratives with fields of NarrativeSerializer in a single query
+    """
+    return queryset.annotate(
+        first_map_datetime=Min("narration__map_datetime"),
+        last_map_datetime=Max("narration__map_datetime"),
+        upvotes=Count(
+            "narrativevote", filter=Q(narrativevote__vote=True), distinct=True
+        ),
+        downvotes=Count(
+            "narrativevote", filter=Q(narrativevote__vote=False), distinct=True
+        ),
+        narration_count=Count("narration", distinct=True),
+    )
+
+
+def jd_year(value):
+    """
+    Converts JDN to year, None stays None
+    """
+    if value is None:
+        return None
+    return jd2gcal(value, 0)[0]
+
+
+class NarrativeSerializer(SparseFieldsMixin, ModelSerializer):
     """
     Serializes the Narrative model
+    Expects instances annotated by annotate_narratives,
+    other instances are annotated with an additional query.
     """
 
     start_year = SerializerMethodField()
@@ -227,39 +287,34 @@ class NarrativeSerializer(ModelSerializer):
         model = Narrative
         fields = "__all__"
 
+    def to_representation(self, instance):
+        if not hasattr(instance, "narration_count"):
+            annotated = annotate_narratives(Narrative.objects.filter(pk=instance.pk))
+            instance = annotated.get()
+        return super().to_representation(instance)
+
     def get_start_year(self, obj):  # pylint: disable=R0201
         """
         Retrieves year of first narration in set
         """
-        if obj.narration_set.first() is not None:
-            return jd2gcal(
-                obj.narration_set.order_by("map_datetime").first().map_datetime, 0
-            )[0]
-        return None
+        return jd_year(obj.first_map_datetime)
 
     def get_end_year(self, obj):  # pylint: disable=R0201
         """
         Retrieves year of last narration in set
         """
-        if obj.narration_set.last() is not None:
-            return jd2gcal(
-                obj.narration_set.order_by("map_datetime").last().map_datetime, 0
-            )[0]
-        return None
+        return jd_year(obj.last_map_datetime)
 
     def get_votes(self, obj):  # pylint: disable=R0201
         """
         Returns dict of upvotes and downvotes
         """
 
-        qs = NarrativeVote.objects.filter(narrative=obj)
-        upvotes = qs.aggregate(upvotes=Count(Case(When(vote=True, then=1))))
-        downvotes = qs.aggregate(downvotes=Count(Case(When(vote=False, then=1))))
-        return {**upvotes, **downvotes}
+        return {"upvotes": obj.upvotes, "downvotes": obj.downvotes}
 
     def get_narration_count(self, obj):  # pylint: disable=R0201
         """
         Returns count of narrations
         """
 
-        return obj.narration_set.count()
+        return obj.narration_count
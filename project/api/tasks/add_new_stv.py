@@ -8,17 +8,24 @@ from django.conf import settings
 from django.db import transaction
 from django.contrib.gis.geos import GEOSGeometry
 
-from api.models import TerritorialEntity, SpacetimeVolume
+from api.models import TerritorialEntity, SpacetimeVolume, jdn_range
 from api.serializers import SpacetimeVolumeSerializer
 from api.helpers.overlaps import subtract_geometry, overlaps_queryset
+from api.helpers.staging import unstage_territory
 
 
 @shared_task
 @transaction.atomic
-def add_new_stv(geom, overlaps_are_missing, **data):
+def add_new_stv(
+    geom=None, overlaps_are_missing=True, staged=None, checksum=None, **data
+):
     """
     Solve overlaps if included in request body
+    Territory is staged by SpacetimeVolumeViewSet,
+    inline geom is accepted from tasks queued before staging.
     """
+    if staged is not None:
+        geom = unstage_territory(staged, checksum)
     geom = GEOSGeometry(geom)
 
     def _overlaps():
@@ -32,8 +39,7 @@ def add_new_stv(geom, overlaps_are_missing, **data):
             cached_as(
                 SpacetimeVolume.objects.filter(
                     territory__overlaps=geom,
-                    start_date__lte=data["end_date"],
-                    end_date__gte=data["start_date"],
+                    during__overlap=jdn_range(data["start_date"], data["end_date"]),
                 ),
                 extra=(data["start_date"], data["end_date"]),
             )
@@ -1,5 +1,6 @@
 """Module that contains tests"""
 from .model_tests import *
+from .mvt_tests import *
 from .cd_tests import *
 from .city_tests import *
 from .ms_tests import *
@@ -69,6 +69,32 @@ class CDTests(APITest):
         self.assertEqual(CachedData.objects.count(), 2)
         self.assertEqual(CachedData.objects.last().event_type, 555)
 
+    def test_api_can_paginate_cds_with_equal_rank(self):
+        """
+        Ensure cursor pages neither skip nor repeat CachedData of equal rank
+        """
+
+        CachedData.objects.bulk_create(
+            CachedData(
+                wikidata_id=wikidata_id,
+                date=self.JD_0001,
+                rank=self.hastings.rank,
+                event_type=CachedData.BATTLE,
+            )
+            for wikidata_id in range(100, 107)
+        )
+        url = reverse("cacheddata-list")
+        params = {"page_size": 2, "fields": "id"}
+        ids = []
+        while url is not None:
+            response = self.client.get(url, params).json()
+            ids.extend(cd["id"] for cd in response["results"])
+            url, params = response["next"], None
+        self.assertEqual(
+            sorted(ids), sorted(CachedData.objects.values_list("id", flat=True))
+        )
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
     @authorized
     @wiki_cd
     def test_api_can_update_cd(self):
@@ -19,6 +19,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 from django.contrib.auth.models import User
 from django.utils.crypto import get_random_string
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.contrib.gis.geos import Point, Polygon
 from django.test import TestCase
 
@@ -184,6 +185,37 @@ class ModelTest(TestCase):
             "SRID=4326;POINT (1.2 1.8)",
         )
 
+    def test_model_keeps_date_ranges(self):
+        """
+        Ensure JDN ranges follow dates on save and on direct updates
+        """
+
+        stv = SpacetimeVolume.objects.create(
+            start_date=self.JD_0001,
+            end_date=self.JD_0002,
+            entity=self.france,
+            territory=Polygon(((1, 1), (1, 2), (2, 2), (1, 1))),
+        )
+        self.assertEqual(
+            (stv.during.lower, stv.during.upper), (self.JD_0001, self.JD_0002)
+        )
+        SpacetimeVolume.objects.filter(pk=stv.pk).update(end_date=self.JD_0003)
+        self.assertTrue(
+            SpacetimeVolume.objects.filter(
+                pk=stv.pk, during__contains=self.JD_0003
+            ).exists()
+        )
+
+        paris = City.objects.create(
+            wikidata_id=1,
+            label="Paris",
+            location=Point(0, 0),
+            inception_date=self.JD_0001,
+        )
+        self.assertTrue(
+            City.objects.filter(pk=paris.pk, during__contains=self.JD_0005).exists()
+        )
+
     def test_model_can_not_create_stv(self):
         """
         Ensure non overlapping timeframe and territory constraints works
@@ -207,6 +239,25 @@ class ModelTest(TestCase):
                 territory=Polygon(((3, 3), (3, 4), (4, 4), (3, 3))),
             )
 
+        # Timeframe is enforced without full_clean as well
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SpacetimeVolume.objects.bulk_create(
+                [
+                    SpacetimeVolume(
+                        start_date=self.JD_0001,
+                        end_date=self.JD_0003,
+                        entity=self.germany,
+                        territory=Polygon(((1, 1), (1, 2), (2, 2), (1, 1))),
+                    ),
+                    SpacetimeVolume(
+                        start_date=self.JD_0002,
+                        end_date=self.JD_0004,
+                        entity=self.germany,
+                        territory=Polygon(((3, 3), (3, 4), (4, 4), (3, 3))),
+                    ),
+                ]
+            )
+
         # Geom type
         with self.assertRaises(ValidationError):
             SpacetimeVolume.objects.create(
@@ -218,6 +269,15 @@ class ModelTest(TestCase):
                 territory=Point(1, 1),
             )
 
+        # Reversed timeframe
+        with self.assertRaises(ValidationError):
+            SpacetimeVolume.objects.create(
+                start_date=self.JD_0005,
+                end_date=self.JD_0004,
+                entity=self.germany,
+                territory=Polygon(((1, 1), (1, 2), (2, 2), (1, 1))),
+            )
+
     @wiki_cd
     def test_model_can_create_narrative(self):
         """
@@ -0,0 +1,374 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2019 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from unittest.mock import patch
+from rest_framework import status
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.db import DatabaseError
+from django.test import SimpleTestCase
+from django.urls import reverse
+from api.helpers.mvt import (
+    date_bucket,
+    date_bucket_layer,
+    stv_mvt_params,
+    update_topology_territory,
+)
+from api.helpers.tile_cache import LRUTileCache
+from api.management.commands.generate_mvt import (
+    covered_tiles,
+    create_mvt_stv,
+    drain_worker,
+    mvt_worker,
+    populate_tile_layout,
+    remove_uncovered_tiles,
+    tile_batches,
+)
+from api.models import (
+    TileLayout,
+    DirtyTile,
+    MVTLayers,
+    SimplifiedTerritory,
+    SpacetimeVolume,
+)
+from api.views.endpoints.mvt_stv import render_stv_tile
+from .api_tests import APITest
+
+
+class MVTTests(APITest):
+    """
+    Vector tiles test suite
+    """
+
+    def test_api_can_query_stv_tile_by_date(self):
+        """
+        Ensure date-aware STV tiles keep only STVs alive at this date
+        """
+
+        url = reverse("mvt-stv", args=[0, 0, 0])
+        response = self.client.get(url, {"date": self.JD_0001})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-protobuf")
+
+        response = self.client.get(url, {"date": self.JD_0005})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get(url, {"date": "nan"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_api_can_query_stv_tile_by_date_bucket(self):
+        """
+        Ensure era bucket tiles are rendered when not pregenerated
+        """
+
+        url = reverse("mvt-stv-bucket", args=[date_bucket(self.JD_0001), 0, 0, 0])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_api_can_revalidate_tile(self):
+        """
+        Ensure tiles have ETag and unchanged tiles are answered with 304
+        """
+
+        url = reverse("mvt-stv", args=[0, 0, 0])
+        response = self.client.get(url, {"date": self.JD_0001})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+
+        response = self.client.get(url, {"date": self.JD_0001}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_stv_save_simplifies_territory(self):
+        """
+        Ensure simplified territory is precomputed for tile zoom levels
+        """
+
+        self.assertTrue(
+            SimplifiedTerritory.objects.filter(stv=self.alsace_stv, zoom=0).exists()
+        )
+        self.alsace_stv.delete()
+        self.assertFalse(SimplifiedTerritory.objects.exists())
+
+    def test_topology_territory_has_no_gaps(self):
+        """
+        Ensure simplified neighbours still share their border
+        """
+
+        # Jagged border between x=4.9 and x=5.1, fine enough to be simplified
+        border = [(5 + (0.1 if i % 2 else -0.1), i * 0.25) for i in range(41)]
+        west = Polygon([(0, 0), *border, (0, 10), (0, 0)], srid=4326)
+        east = Polygon([(10, 0), *border, (10, 10), (10, 0)], srid=4326)
+        stvs = [
+            SpacetimeVolume.objects.create(
+                start_date=self.JD_0003,
+                end_date=self.JD_0004,
+                entity=entity,
+                territory=territory,
+            )
+            for entity, territory in ((self.germany, west), (self.france, east))
+        ]
+        bucket = date_bucket(self.JD_0003)
+        update_topology_territory(bucket)
+
+        simplified = [
+            SimplifiedTerritory.objects.get(stv=stv, zoom=0, bucket=bucket).territory
+            for stv in stvs
+        ]
+        self.assertLess(simplified[0].num_coords, west.num_coords)
+        merged = simplified[0].union(simplified[1])
+        self.assertEqual(merged.geom_type, "Polygon")
+        self.assertEqual(merged.num_interior_rings, 0)
+        expected = west.union(east).transform(3857, clone=True).area
+        self.assertAlmostEqual(merged.area, expected, delta=expected * 1e-4)
+
+    def test_batched_tiles_match_per_tile_rendering(self):
+        """
+        Ensure one batch stores the tiles the per-tile query renders
+        """
+
+        coords = [(0, 0), (0, 1), (1, 0), (1, 1)]
+        create_mvt_stv(1, coords)
+        tiles = {
+            (x_coor, y_coor): bytes(tile)
+            for x_coor, y_coor, tile in MVTLayers.objects.filter(
+                layer="stv", zoom=1
+            ).values_list("x_coor", "y_coor", "tile")
+        }
+        self.assertEqual(sorted(tiles), coords)
+        # Alsace is in the north-east quarter
+        self.assertNotEqual(tiles[(1, 0)], b"")
+        self.assertEqual(tiles[(0, 1)], b"")
+        for (x_coor, y_coor), tile in tiles.items():
+            self.assertEqual(
+                tile, render_stv_tile("stv", [], stv_mvt_params(1, x_coor, y_coor))
+            )
+
+    def test_rendering_again_does_not_duplicate_tiles(self):
+        """
+        Ensure re-run or resumed batches replace stored tiles
+        """
+
+        bucket = date_bucket(self.JD_0001)
+        batches = list(tile_batches([(1, 0, 0), (1, 1, 0), (1, 1, 1)], 2))
+        self.assertEqual(batches, [(1, [(0, 0), (1, 0)]), (1, [(1, 1)])])
+        for zoom, coords in batches:
+            self.assertEqual(mvt_worker(zoom, coords, [None, bucket]), len(coords))
+        stored = dict(
+            MVTLayers.objects.filter(zoom=1, x_coor=1, y_coor=0).values_list(
+                "layer", "tile"
+            )
+        )
+        self.assertEqual(set(stored), {"stv", date_bucket_layer(bucket)})
+
+        # Run interrupted after the first batch is resumed from the start
+        mvt_worker(*batches[0], [None, bucket])
+        create_mvt_stv(1, [(1, 0)])
+        self.assertEqual(MVTLayers.objects.filter(zoom=1).count(), 6)
+        self.assertEqual(
+            bytes(MVTLayers.objects.get(layer="stv", zoom=1, x_coor=1, y_coor=0).tile),
+            bytes(stored["stv"]),
+        )
+
+    def add_stvs(self, *territories):
+        """Germany's STVs with consecutive timeframes"""
+        for i, territory in enumerate(territories):
+            SpacetimeVolume.objects.create(
+                start_date=self.JD_0003 + 2 * i,
+                end_date=self.JD_0003 + 2 * i + 1,
+                entity=self.germany,
+                territory=territory,
+            )
+
+    def coverage(self, zoom):
+        """Tiles of the zoom level left by quadtree pruning"""
+        coverage = [(0, 0)]
+        for level in range(0, zoom + 1):
+            populate_tile_layout(level, pow(2, level))
+            coverage = covered_tiles(level, coverage)
+        return set(coverage)
+
+    def test_coverage_keeps_tiles_of_straddling_stv(self):
+        """
+        Ensure STV on the corner of four tiles covers all of them
+        """
+
+        self.add_stvs(Polygon.from_bbox((-1, -1, 1, 1)))
+        # Alsace is in (2, 1)
+        self.assertEqual(self.coverage(2), {(1, 1), (2, 1), (1, 2), (2, 2)})
+
+    def test_coverage_keeps_tiles_of_tiny_island(self):
+        """
+        Ensure STV smaller than a tile pixel isn't pruned
+        """
+
+        self.add_stvs(Polygon.from_bbox((-150, -40, -149.9999, -39.9999)))
+        self.assertEqual(self.coverage(1), {(0, 1), (1, 0)})
+        self.assertEqual(self.coverage(2), {(0, 2), (2, 1)})
+
+    def test_coverage_of_antimeridian_and_world_stvs(self):
+        """
+        Ensure STV split on the antimeridian covers both edges of the map
+        and STV of the world extent covers every tile
+        """
+
+        self.add_stvs(
+            MultiPolygon(
+                Polygon.from_bbox((179, 10, 180, 20)),
+                Polygon.from_bbox((-180, 10, -179, 20)),
+            )
+        )
+        self.assertEqual(self.coverage(2), {(0, 1), (2, 1), (3, 1)})
+
+        SpacetimeVolume.objects.filter(entity=self.germany).delete()
+        self.add_stvs(Polygon.from_bbox((-180, -85, 180, 85)))
+        self.assertEqual(len(self.coverage(2)), 16)
+
+    def test_remove_uncovered_tiles(self):
+        """
+        Ensure only STV tiles of the level outside of coverage are removed
+        """
+
+        for zoom, x_coor, y_coor, layer in (
+            (2, 0, 0, "stv"),
+            (2, 0, 0, "stv:5"),
+            (2, 0, 0, "cities"),
+            (2, 2, 1, "stv"),
+            (1, 0, 0, "stv"),
+        ):
+            MVTLayers.objects.create(
+                zoom=zoom, x_coor=x_coor, y_coor=y_coor, layer=layer, tile=b""
+            )
+        coverage = self.coverage(2)
+        self.assertEqual(coverage, {(2, 1)})
+        self.assertEqual(remove_uncovered_tiles(2, coverage), 2)
+        self.assertEqual(
+            set(MVTLayers.objects.values_list("zoom", "x_coor", "y_coor", "layer")),
+            {(2, 0, 0, "cities"), (2, 2, 1, "stv"), (1, 0, 0, "stv")},
+        )
+
+    def test_stv_save_bumps_tile_version(self):
+        """
+        Ensure tiles covered by old or new territory get new version and are queued
+        """
+
+        world = TileLayout.objects.create(
+            zoom=0,
+            x_coor=0,
+            y_coor=0,
+            bbox=Polygon.from_bbox((-180, -85.06, 180, 85.06)),
+        )
+        ocean = TileLayout.objects.create(
+            zoom=1,
+            x_coor=0,
+            y_coor=1,
+            bbox=Polygon.from_bbox((-180, -85.06, 0, 0)),
+        )
+        self.alsace_stv.references = ["new"]
+        self.alsace_stv.save()
+        world.refresh_from_db()
+        ocean.refresh_from_db()
+        self.assertGreater(world.version, 0)
+        self.assertEqual(ocean.version, 0)
+        self.assertTrue(DirtyTile.objects.filter(zoom=0, x_coor=0, y_coor=0).exists())
+        self.assertFalse(DirtyTile.objects.filter(zoom=1).exists())
+
+    def test_regenerated_tiles_get_new_version(self):
+        """
+        Ensure tiles cached before regeneration are not served after it
+        """
+
+        world = TileLayout.objects.create(
+            zoom=0,
+            x_coor=0,
+            y_coor=0,
+            bbox=Polygon.from_bbox((-180, -85.06, 180, 85.06)),
+        )
+        self.alsace_stv.references = ["new"]
+        self.alsace_stv.save()
+        world.refresh_from_db()
+        saved = world.version
+
+        self.assertEqual(drain_worker(16, [None]), 1)
+        world.refresh_from_db()
+        self.assertGreater(world.version, saved)
+        self.assertFalse(DirtyTile.objects.exists())
+
+    def test_drain_worker_regenerates_queued_tiles(self):
+        """
+        Ensure one drain pass renders exactly the queued tiles and empties the queue,
+        tiles stay queued when rendering fails
+        """
+
+        populate_tile_layout(0, 1)
+        populate_tile_layout(1, 2)
+        self.alsace_stv.references = ["new"]
+        self.alsace_stv.save()
+        queued = {(0, 0, 0), (1, 1, 0)}
+        self.assertEqual(
+            set(DirtyTile.objects.values_list("zoom", "x_coor", "y_coor")), queued
+        )
+
+        with patch(
+            "api.management.commands.generate_mvt.create_mvt_stv",
+            side_effect=DatabaseError,
+        ):
+            with self.assertRaises(DatabaseError):
+                drain_worker(16, [None])
+        self.assertEqual(DirtyTile.objects.count(), 2)
+        self.assertFalse(MVTLayers.objects.exists())
+
+        self.assertEqual(drain_worker(16, [None]), 2)
+        self.assertFalse(DirtyTile.objects.exists())
+        self.assertEqual(
+            set(MVTLayers.objects.values_list("zoom", "x_coor", "y_coor", "layer")),
+            {(zoom, x_coor, y_coor, "stv") for zoom, x_coor, y_coor in queued},
+        )
+        self.assertEqual(drain_worker(16, [None]), 0)
+
+
+class LRUTileCacheTests(SimpleTestCase):
+    """
+    In-process tile cache test suite
+    """
+
+    def test_cache_is_bounded_by_size(self):
+        """
+        Ensure least recently used tiles are evicted when cache is full
+        """
+
+        cache = LRUTileCache(10)
+        cache.set("a", ("etag-a", b"aaaa"), 60)
+        cache.set("b", ("etag-b", b"bbbb"), 60)
+        self.assertEqual(cache.get("a"), ("etag-a", b"aaaa"))
+        cache.set("c", ("etag-c", b"cccc"), 60)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), ("etag-a", b"aaaa"))
+        self.assertEqual(cache.size, 8)
+
+    def test_cache_entries_expire(self):
+        """
+        Ensure expired tiles are not served
+        """
+
+        cache = LRUTileCache(10)
+        cache.set("a", ("etag-a", b"aaaa"), -1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.size, 0)
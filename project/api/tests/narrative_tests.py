@@ -21,8 +21,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from rest_framework import status
 from django.urls import reverse
+from django.db import connection
 from django.test import tag
+from django.test.utils import CaptureQueriesContext
 from api.models import Narrative
+from api.factories import NarrativeFactory, NarrationFactory
 from .api_tests import APITest, authorized
 
 
@@ -101,3 +104,40 @@ class NarrativeTests(APITest):
         response = self.client.get(url, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["votes"], {"upvotes": 1, "downvotes": 0})
+
+    @authorized
+    def test_api_narratives_query_count(self):
+        """
+        Ensure listing Narratives takes the same number of queries for any count
+        """
+
+        url = reverse("narrative-list")
+        with CaptureQueriesContext(connection) as single:
+            response = self.client.get(url, format="json")
+        self.assertEqual(response.data[0]["start_year"], 2)
+        self.assertEqual(response.data[0]["narration_count"], 1)
+
+        for i in range(3):
+            narrative = NarrativeFactory(
+                author="Test Author",
+                title="Test Narrative",
+                url="test-{}".format(i),
+                description="This is a test narrative for automated testing.",
+                tags=["test"],
+            )
+            NarrationFactory(
+                narrative=narrative,
+                title="Test Narration",
+                description="This is a narration point",
+                date_label="test",
+                map_datetime=self.JD_0001,
+                settings=self.norman_conquest_settings,
+                location=self.hastings_narration.location,
+            )
+
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url, format="json")
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(response.data[0]["votes"], {"upvotes": 1, "downvotes": 0})
+        self.assertEqual(response.data[1]["end_year"], 1)
+        self.assertEqual(len(many.captured_queries), len(single.captured_queries))
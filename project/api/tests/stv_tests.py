@@ -19,16 +19,29 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import gzip
 import json
+import os
+import tempfile
 from unittest.mock import patch, MagicMock
 from rest_framework import status
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.gis.geos import GEOSGeometry
 from django.urls import reverse
 from django.test import override_settings
-from api.models import SpacetimeVolume
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from api.models import SpacetimeVolume, StagedTerritory
 from api.helpers.geometry import calculate_area
+from api.helpers.overlaps import subtract_geometry
+from api.helpers.staging import (
+    STAGED_TERRITORY_EXPIRY,
+    stage_territory,
+    unstage_territory,
+)
 from api.tasks.add_new_stv import add_new_stv
+from api.views.stv_view import _validate_geometry
 from .api_tests import APITest, authorized
 
 DELAYED = MagicMock()
@@ -74,8 +87,11 @@ class STVTests(APITest):
         self.assertEqual(response.json()["task_id"], DELAYED.id)
 
         args, kwargs = task.call_args
+        self.assertNotIn("geom", kwargs)
+        self.assertTrue(StagedTerritory.objects.filter(pk=kwargs["staged"]).exists())
         res = add_new_stv(*args, **kwargs)
         self.assertEqual(res["status"], status.HTTP_201_CREATED)
+        self.assertFalse(StagedTerritory.objects.exists())
 
         self.assertEqual(SpacetimeVolume.objects.count(), 2)
         self.assertEqual(SpacetimeVolume.objects.last().references, ["ref"])
@@ -115,6 +131,133 @@ class STVTests(APITest):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["end_date"], str(self.JD_0002))
 
+    @override_settings(CACHEOPS_ENABLED=False)
+    def test_api_can_query_stv_fields(self):
+        """
+        Ensure SpacetimeVolumes can be listed without territory
+        """
+
+        url = reverse("spacetimevolume-list")
+        response = self.client.get(url, {"fields": "id,entity,start_date"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            [
+                {
+                    "id": self.alsace_stv.pk,
+                    "entity": self.france.pk,
+                    "start_date": str(self.JD_0001),
+                }
+            ],
+        )
+
+    @override_settings(CACHEOPS_ENABLED=False)
+    def test_api_can_filter_stvs(self):
+        """
+        Ensure SpacetimeVolumes can be filtered by place and time
+        """
+
+        url = reverse("spacetimevolume-list")
+        self.assertEqual(len(self.client.get(url).data), 1)
+        matching = [
+            {"date": self.JD_0001},
+            {"start_date": self.JD_0002, "end_date": self.JD_0005},
+            {"bbox": "0,0,1.5,1.5", "entity": self.france.pk},
+            {"admin_level": self.france.admin_level},
+        ]
+        for params in matching:
+            response = self.client.get(url, params)
+            self.assertEqual(len(response.data), 1, params)
+        other = [
+            {"date": self.JD_0005},
+            # Not truncated to the last day of Alsace
+            {"date": self.JD_0002 + 0.5},
+            {"bbox": "10,10,20,20"},
+            {"entity": self.germany.pk},
+        ]
+        for params in other:
+            response = self.client.get(url, params)
+            self.assertEqual(response.data, [], params)
+
+        for params in [
+            {"bbox": "1,2"},
+            {"date": "x"},
+            {"start_date": ""},
+            {"date": "nan"},
+            {"end_date": "inf"},
+        ]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        circle = GEOSGeometry("SRID=4326;POINT(5 5)").buffer(1)
+        SpacetimeVolume.objects.create(
+            start_date=self.JD_0001,
+            end_date=self.JD_0002,
+            entity=self.germany,
+            territory=circle,
+        )
+        self.assertEqual(len(self.client.get(url).data), 2)
+        response = self.client.get(url, {"simplify": 0.5, "entity": self.germany.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        territory = GEOSGeometry(json.dumps(response.data[0]["territory"]))
+        self.assertLess(territory.num_coords, circle.num_coords)
+        self.assertTrue(territory.valid)
+
+    @override_settings(CACHEOPS_ENABLED=False)
+    @authorized
+    def test_api_can_create_stv_from_feature_collection(self):
+        """
+        Ensure features are reprojected and merged into one territory
+        """
+
+        size = 10000
+        features = [
+            {
+                "type": "Feature",
+                "properties": {},
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [
+                        [
+                            [x * size, y * size],
+                            [x * size, (y + 1) * size],
+                            [(x + 1) * size, (y + 1) * size],
+                            [(x + 1) * size, y * size],
+                            [x * size, y * size],
+                        ]
+                    ],
+                },
+            }
+            for x in range(10)
+            for y in range(10)
+        ]
+        collection = {
+            "type": "FeatureCollection",
+            "crs": {"type": "name", "properties": {"name": "EPSG:3857"}},
+            "features": features,
+        }
+        data = {
+            "start_date": self.JD_0003,
+            "end_date": self.JD_0004,
+            "entity": self.germany.pk,
+            "territory": SimpleUploadedFile(
+                "collection.json",
+                json.dumps(collection).encode(),
+                content_type="application/json",
+            ),
+        }
+        with patch("api.tasks.add_new_stv.add_new_stv.delay") as task:
+            task.return_value = DELAYED
+            response = self.client.post(reverse("spacetimevolume-list"), data)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn("union;dur=", response["Server-Timing"])
+        staged = StagedTerritory.objects.get(pk=task.call_args[1]["staged"])
+        geom = GEOSGeometry(bytes(staged.ewkb))
+        self.assertEqual(geom.geom_type, "Polygon")
+        self.assertEqual(geom.srid, 4326)
+        self.assertAlmostEqual(geom.extent[2], 0.898, places=3)
+
     @override_settings(CACHEOPS_ENABLED=False)
     @authorized
     def test_api_can_not_create_stv(self):
@@ -191,3 +334,251 @@ class STVTests(APITest):
             args, kwargs = task.call_args
             res = add_new_stv(*args, **kwargs)
             self.assertEqual(res["status"], status.HTTP_409_CONFLICT)
+
+    def test_geometry_collection_is_repaired(self):
+        """
+        Ensure polygonal parts of collections are made valid and merged
+        """
+
+        geom = _validate_geometry(
+            GEOSGeometry(
+                "SRID=4326;GEOMETRYCOLLECTION("
+                "POLYGON((0 0, 0 2, 2 2, 2 0, 0 0)),"
+                "POLYGON((1 1, 1 3, 3 3, 3 1, 1 1)),"
+                "POLYGON((5 5, 7 7, 7 5, 5 7, 5 5)),"
+                "LINESTRING(10 10, 11 11))"
+            )
+        )
+        self.assertTrue(geom.valid)
+        self.assertEqual(geom.geom_type, "MultiPolygon")
+        self.assertEqual(len(geom), 3)
+        self.assertAlmostEqual(geom.area, 9)
+
+        with self.assertRaises(ValidationError):
+            _validate_geometry(
+                GEOSGeometry("SRID=4326;POLYGON((170 0, 170 1, 190 1, 190 0, 170 0))")
+            )
+
+    def test_subtract_geometry(self):
+        """
+        Ensure kept STVs clip the new territory and modified STVs are clipped
+        """
+
+        germany_stv = SpacetimeVolume.objects.create(
+            start_date=self.JD_0001,
+            end_date=self.JD_0002,
+            entity=self.germany,
+            territory=GEOSGeometry("SRID=4326;POLYGON((4 4, 4 6, 6 6, 6 4, 4 4))"),
+        )
+        italy_stv = SpacetimeVolume.objects.create(
+            start_date=self.JD_0001,
+            end_date=self.JD_0002,
+            entity=self.italy,
+            territory=GEOSGeometry("SRID=4326;POLYGON((9 9, 9 12, 12 12, 12 9, 9 9))"),
+        )
+        overlaps = {
+            "keep": [],
+            "modify": [],
+            "db": {
+                self.germany.pk: [germany_stv.pk],
+                self.france.pk: [self.alsace_stv.pk],
+                self.italy.pk: [italy_stv.pk],
+            },
+        }
+        geom = subtract_geometry(
+            [str(self.france.pk), str(self.italy.pk)],
+            overlaps,
+            GEOSGeometry("SRID=4326;POLYGON((0 0, 0 10, 10 10, 10 0, 0 0))"),
+        )
+
+        self.assertAlmostEqual(geom.area, 96)
+        self.assertFalse(geom.intersects(germany_stv.territory.point_on_surface))
+        self.assertFalse(SpacetimeVolume.objects.filter(pk=self.alsace_stv.pk).exists())
+        italy_stv.refresh_from_db()
+        self.assertAlmostEqual(italy_stv.territory.area, 8)
+        self.assertEqual(italy_stv.history.count(), 2)
+
+    def test_staged_territory(self):
+        """
+        Ensure staged territory is checked and expired uploads are deleted
+        """
+
+        geom = GEOSGeometry("SRID=4326;POLYGON((4 4, 4 6, 6 6, 6 4, 4 4))")
+        staged, checksum = stage_territory(geom)
+        with self.assertRaises(ValidationError):
+            unstage_territory(staged, "0" * 64)
+        self.assertEqual(GEOSGeometry(unstage_territory(staged, checksum)), geom)
+        with self.assertRaises(ValidationError):
+            unstage_territory(staged, checksum)
+
+        staged, _ = stage_territory(geom)
+        StagedTerritory.objects.filter(pk=staged).update(
+            created=timezone.now() - STAGED_TERRITORY_EXPIRY
+        )
+        stage_territory(geom)
+        call_command("clean_staged_territories")
+        self.assertEqual(StagedTerritory.objects.count(), 1)
+
+    def test_api_can_export_stvs(self):
+        """
+        Ensure STVs are streamed as FeatureCollection with filters applied
+        """
+
+        url = reverse("stv-export")
+        response = self.client.get(url, {"entity": self.france.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data["type"], "FeatureCollection")
+        self.assertEqual(len(data["features"]), 1)
+        self.assertEqual(data["features"][0]["id"], self.alsace_stv.pk)
+        self.assertEqual(data["features"][0]["geometry"]["type"], "Polygon")
+
+        response = self.client.get(url, {"bbox": "10,10,20,20"})
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data["features"], [])
+
+        response = self.client.get(url, {"start_date": self.JD_0005})
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data["features"], [])
+
+        for params in [{"bbox": "1,2"}, {"start_date": "x"}, {"end_date": "nan"}]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_stvs_command(self):
+        """
+        Ensure export_stvs writes one Feature per line
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stv.json.gz")
+            call_command("export_stvs", self.alsace_stv.pk, output=path, gzip=True)
+            with gzip.open(path, "rt") as result:
+                lines = result.read().splitlines()
+            self.assertEqual(os.listdir(directory), ["stv.json.gz"])
+
+        self.assertEqual(len(lines), 1)
+        feature = json.loads(lines[0])
+        self.assertEqual(feature["id"], self.alsace_stv.pk)
+        self.assertNotIn("territory", feature["properties"])
+
+    def test_api_can_lookup_stvs_at_point(self):
+        """
+        Ensure STVs and parent entities are found by location and date
+        """
+
+        germany_stv = SpacetimeVolume.objects.create(
+            start_date=self.JD_0001,
+            end_date=self.JD_0002,
+            entity=self.germany,
+            territory=GEOSGeometry("SRID=4326;POLYGON((4 4, 4 6, 6 6, 6 4, 4 4))"),
+        )
+        url = reverse("stv-at")
+        response = self.client.get(url, {"lon": 5, "lat": 5, "date": self.JD_0001})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual([stv["stv"] for stv in data], [germany_stv.pk])
+        self.assertEqual(
+            [parent["entity"] for parent in data[0]["parents"]],
+            [self.european_union.pk],
+        )
+
+        response = self.client.post(
+            url,
+            {
+                "points": [
+                    [5, 5, self.JD_0005],
+                    [1.2, 1.8, self.JD_0001],
+                    [5, 5, self.JD_0002],
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data[0], [])
+        self.assertEqual(data[1][0]["stv"], self.alsace_stv.pk)
+        self.assertEqual(data[1][0]["parents"], [])
+        self.assertEqual(data[2][0]["entity"], self.germany.pk)
+
+        response = self.client.post(
+            url, {"cached_data": [self.hastings.pk]}, format="json"
+        )
+        self.assertEqual(response.json(), {str(self.hastings.pk): []})
+
+        response = self.client.get(url, {"lon": 500, "lat": 5, "date": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_stvs_command(self):
+        """
+        Ensure import_stvs repairs geometry and rejects overlapping STVs
+        """
+
+        def feature(entity, start_date, end_date, coordinates):
+            return {
+                "type": "Feature",
+                "properties": {
+                    "entity": entity,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                },
+                "geometry": {"type": "Polygon", "coordinates": [coordinates]},
+            }
+
+        bowtie = [[10, 10], [12, 12], [12, 10], [10, 12], [10, 10]]
+        square = [[10, 10], [10, 12], [12, 12], [12, 10], [10, 10]]
+        features = [
+            feature(self.germany.pk, self.JD_0002, self.JD_0003, bowtie),
+            feature(self.germany.pk, self.JD_0002, self.JD_0004, square),
+            feature(self.france.pk, self.JD_0001, self.JD_0003, square),
+        ]
+        te_history = self.germany.history.count()
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "stvs.geojson"), "w") as output:
+                json.dump({"type": "FeatureCollection", "features": features}, output)
+            call_command("import_stvs", directory)
+
+        france_stvs = SpacetimeVolume.objects.filter(entity=self.france)
+        self.assertEqual(list(france_stvs), [self.alsace_stv])
+        stv = SpacetimeVolume.objects.get(entity=self.germany)
+        self.assertTrue(stv.territory.valid)
+        self.assertEqual(stv.territory.geom_type, "MultiPolygon")
+        self.assertTrue(stv.territory.intersects(stv.visual_center))
+        self.assertEqual(stv.history.count(), 1)
+        self.germany.refresh_from_db()
+        self.assertEqual(self.germany.dissolution_date, self.JD_0003)
+        self.assertEqual(self.germany.history.count(), te_history + 1)
+
+    def test_import_stvs_accepts_rows_in_order(self):
+        """
+        Ensure a row rejected for overlapping an earlier row
+        doesn't reject the rows after it
+        """
+
+        square = [[10, 10], [10, 12], [12, 12], [12, 10], [10, 10]]
+        dates = [
+            (self.JD_0001, self.JD_0003),
+            (self.JD_0002, self.JD_0004),
+            (self.JD_0003 + 1, self.JD_0005),
+        ]
+        features = [
+            {
+                "type": "Feature",
+                "properties": {"start_date": start_date, "end_date": end_date},
+                "geometry": {"type": "Polygon", "coordinates": [square]},
+            }
+            for start_date, end_date in dates
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stvs.geojson")
+            with open(path, "w") as output:
+                json.dump({"type": "FeatureCollection", "features": features}, output)
+            call_command("import_stvs", path, entity=self.germany.pk)
+
+        imported = SpacetimeVolume.objects.filter(entity=self.germany).order_by(
+            "start_date"
+        )
+        self.assertEqual(
+            [(stv.start_date, stv.end_date) for stv in imported],
+            [dates[0], dates[2]],
+        )
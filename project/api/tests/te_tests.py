@@ -19,9 +19,16 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import gzip
+import json
+from datetime import timedelta
 from rest_framework import status
+from django.core.management import call_command
+from django.db import connection
 from django.urls import reverse
-from api.models import TerritorialEntity
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from api.models import TerritorialEntity, SpacetimeVolume, TEListChange
 from .api_tests import APITest, authorized
 
 
@@ -91,3 +98,135 @@ class TETests(APITest):
         response = self.client.get(url, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["admin_level"], 1)
+
+    def test_api_can_list_tes(self):
+        """
+        Ensure territorial-entities/list follows entity and STV changes
+        """
+
+        url = reverse("te-list")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        entities = {te["id"]: te for te in response.json()}
+        self.assertEqual(len(entities), TerritorialEntity.objects.count())
+        self.assertEqual(entities[self.france.pk]["stv_count"], 1)
+        self.assertEqual(entities[self.france.pk]["stvs"][0]["id"], self.alsace_stv.pk)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.alsace_stv.entity = self.germany
+        self.alsace_stv.save()
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING="gzip, deflate"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        entities = {
+            te["id"]: te for te in json.loads(gzip.decompress(response.content))
+        }
+        self.assertEqual(entities[self.france.pk]["stv_count"], 0)
+        self.assertEqual(entities[self.germany.pk]["stv_count"], 1)
+
+    def test_api_can_list_te_changes(self):
+        """
+        Ensure territorial-entities/changes returns changed entities and tombstones
+        """
+
+        url = reverse("te-changes")
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        since = int(self.client.get(reverse("te-list"))["X-Sync-Version"])
+
+        # Test transaction isn't committed, it's changes are still returned
+        response = self.client.get(url, {"since": since})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(self.france.pk, [te["id"] for te in response.json()["entities"]])
+
+        # Changes of earlier transactions are skipped
+        TEListChange.objects.update(txid=since - 1)
+        response = self.client.get(url, {"since": since})
+        self.assertEqual(response.json()["entities"], [])
+
+        # Both entities are reported when STV is moved
+        self.alsace_stv.entity = self.germany
+        self.alsace_stv.save()
+        response = self.client.get(url, {"since": since}).json()
+        self.assertEqual(
+            [te["id"] for te in response["entities"]],
+            sorted([self.france.pk, self.germany.pk]),
+        )
+
+        TEListChange.objects.all().delete()
+        stv_id = self.alsace_stv.pk
+        self.alsace_stv.delete()
+        response = self.client.get(url, {"since": since}).json()
+        self.assertGreaterEqual(response["version"], since)
+        self.assertEqual([te["id"] for te in response["entities"]], [self.germany.pk])
+        self.assertEqual(response["entities"][0]["stv_count"], 0)
+        self.assertEqual(response["deleted"], {"entities": [], "stvs": [stv_id]})
+
+    def test_te_changes_expire(self):
+        """
+        Ensure changes are logged once per transaction and expired cursors get 410
+        """
+
+        url = reverse("te-changes")
+        since = int(self.client.get(reverse("te-list"))["X-Sync-Version"])
+        self.alsace_stv.save()
+        self.alsace_stv.save()
+        # Test data and the test share one transaction
+        self.assertEqual(TEListChange.objects.filter(entity=self.france).count(), 1)
+
+        TEListChange.objects.update(created=timezone.now() - timedelta(days=365))
+        call_command("clean_te_changes")
+        horizon = TEListChange.objects.get(entity=None, stv=None).txid
+        self.assertGreater(horizon, since)
+        response = self.client.get(url, {"since": since})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        response = self.client.get(url, {"since": horizon})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["entities"], [])
+
+    def test_api_can_paginate_tes(self):
+        """
+        Ensure TerritorialEntities are paginated with cursor on request
+        """
+
+        url = reverse("territorialentity-list")
+        response = self.client.get(url, {"page_size": 2, "fields": "id,label"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual(set(response.data["results"][0]), {"id", "label"})
+        ids = [te["id"] for te in response.data["results"]]
+        while response.data["next"] is not None:
+            response = self.client.get(response.data["next"])
+            ids.extend(te["id"] for te in response.data["results"])
+        self.assertEqual(
+            ids, sorted(TerritorialEntity.objects.values_list("id", flat=True))
+        )
+
+    def test_api_tes_query_count(self):
+        """
+        Ensure listing TerritorialEntities doesn't query STVs per entity
+        """
+
+        url = reverse("territorialentity-list")
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+
+        SpacetimeVolume.objects.create(
+            start_date=self.JD_0001,
+            end_date=self.JD_0002,
+            entity=self.germany,
+            territory=self.alsace_stv.territory,
+        )
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        self.assertEqual(len(after.captured_queries), len(before.captured_queries))
+        germany = next(te for te in response.data if te["id"] == self.germany.pk)
+        self.assertEqual(germany["stv_count"], 1)
+        self.assertNotIn("territory", germany["stvs"][0])
+        self.assertFalse(
+            any('"territory"' in query["sql"] for query in after.captured_queries)
+        )
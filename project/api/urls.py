@@ -39,23 +39,31 @@ ROUTER.register(r"symbol-features", views.SymbolFeatureViewSet)
 
 urlpatterns = [
     path(
-        "mvt/cached-data/<int:zoom>/<int:x_cor>/<int:y_cor>",
+        "mvt/cached-data/<int:zoom>/<int:x_coor>/<int:y_coor>",
         views.mvt_cacheddata,
         name="mvt-cacheddata",
     ),
     path(
-        "mvt/cities/<int:zoom>/<int:x_cor>/<int:y_cor>",
+        "mvt/cities/<int:zoom>/<int:x_coor>/<int:y_coor>",
         views.mvt_cities,
         name="mvt-cities",
     ),
     path(
-        "mvt/narratives/<int:zoom>/<int:x_cor>/<int:y_cor>",
+        "mvt/narratives/<int:zoom>/<int:x_coor>/<int:y_coor>",
         views.mvt_narratives,
         name="mvt-narratives",
     ),
     path("mvt/stv/<int:zoom>/<int:x_coor>/<int:y_coor>", views.mvt_stv, name="mvt-stv"),
+    path(
+        "mvt/stv/<int:bucket>/<int:zoom>/<int:x_coor>/<int:y_coor>",
+        views.mvt_stv_bucket,
+        name="mvt-stv-bucket",
+    ),
     path("spacetime-volumes/<int:primary_key>/download", views.stv_downloader),
+    path("spacetime-volumes/export", views.stv_export, name="stv-export"),
+    path("spacetime-volumes/at", views.stv_at, name="stv-at"),
     path("spacetime-volumes/tasks/<str:task_id>", views.stv_tasks),
-    path("territorial-entities/list", views.te_list),
+    path("territorial-entities/list", views.te_list, name="te-list"),
+    path("territorial-entities/changes", views.te_changes, name="te-changes"),
     path("", include(ROUTER.urls)),
 ]
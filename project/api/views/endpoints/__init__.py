@@ -5,5 +5,8 @@ from .mvt_cities import *
 from .mvt_narratives import *
 from .mvt_stv import *
 from .stv_downloader import *
+from .stv_export import *
+from .stv_at import *
 from .te_list import *
+from .te_changes import *
 from .stv_tasks import *
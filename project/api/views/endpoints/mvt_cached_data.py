@@ -21,9 +21,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from django.db import connection
 from django.http import HttpResponse
+from api.helpers.tile_cache import cached_tile
 
 # https://medium.com/@mrgrantanderson/https-medium-com-serving-vector-tiles-from-django-38c705f677cf
-def mvt_cacheddata(request, zoom, x_cor, y_cor):
+@cached_tile("cached-data")
+def mvt_cacheddata(request, zoom, x_coor, y_coor):
     """
     Custom view to serve Mapbox Vector Tiles for CachedData.
     """
@@ -54,7 +56,7 @@ def mvt_cacheddata(request, zoom, x_cor, y_cor):
                     WHERE i <= 20
                 ) AS tile
             """,
-            [zoom, x_cor, y_cor],
+            [zoom, x_coor, y_coor],
         )
         tile = bytes(cursor.fetchone()[0])
         if not tile:
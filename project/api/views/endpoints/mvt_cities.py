@@ -21,9 +21,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from django.db import connection
 from django.http import HttpResponse
+from api.helpers.tile_cache import cached_tile
 
 
-def mvt_cities(request, zoom, x_cor, y_cor):
+@cached_tile("cities")
+def mvt_cities(request, zoom, x_coor, y_coor):
     """
     Custom view to serve Mapbox Vector Tiles for Cities.
     """
@@ -63,7 +65,7 @@ def mvt_cities(request, zoom, x_cor, y_cor):
                 WHERE visual_center && TileBBox(%s, %s, %s, 4326)
                 ) as vc
             """,
-            [zoom, x_cor, y_cor, zoom, x_cor, y_cor, zoom, x_cor, y_cor],
+            [zoom, x_coor, y_coor, zoom, x_coor, y_coor, zoom, x_coor, y_coor],
         )
 
         first_row = cursor.fetchone()[0]
@@ -21,9 +21,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from django.db import connection
 from django.http import HttpResponse
+from api.helpers.tile_cache import cached_tile
 
 
-def mvt_narratives(request, zoom, x_cor, y_cor):
+@cached_tile("narratives")
+def mvt_narratives(request, zoom, x_coor, y_coor):
     """
     Custom view to serve Mapbox Vector Tiles for Narratives with Symbols and Attached Events.
     """
@@ -59,7 +61,7 @@ def mvt_narratives(request, zoom, x_cor, y_cor):
                 JOIN api_symbolfeature ON api_symbol.id = api_symbolfeature.symbol_id
             ) as symbols
             """,
-            [zoom, x_cor, y_cor, zoom, x_cor, y_cor],
+            [zoom, x_coor, y_coor, zoom, x_coor, y_coor],
         )
 
         first_row = cursor.fetchone()[0]
@@ -19,93 +19,105 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.db import connection
 from api.models import MVTLayers
+from api.helpers.query_params import parse_date, parse_ints
+from api.helpers.tile_cache import cached_tile
+from api.helpers.mvt import (
+    MVT_STV_DATE_FILTER,
+    stv_mvt_geom_query,
+    stv_mvt_params,
+    stv_mvt_layer,
+)
+
+
+def render_stv_tile(name, where, params):
+    """Build STV tile in PostGIS"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT ST_AsMVT(a, %(name)s) AS tile
+            FROM ({}) AS a
+            """.format(  # nosec
+                stv_mvt_geom_query(params["zoom"], where)
+            ),
+            {"name": name, **params},
+        )
+        return bytes(cursor.fetchone()[0])
 
-MVT_STV_QUERY = """
-    SELECT
-        id, start_date, end_date, "references", entity_id, wikidata_id, color, admin_level
-        , ST_AsMVTGeom(
-            ST_SnapToGrid(ST_Transform(ST_Simplify(territory, %(simplification)s), 3857), 1)
-            , TileBBox(%(zoom)s, %(x_coor)s, %(y_coor)s)) as territory
-    FROM view_stvmap
-    WHERE ST_Intersects(territory, TileBBox(%(zoom)s, %(x_coor)s, %(y_coor)s, 4326))
-"""
 
+def pregenerated_tile(layer, zoom, x_coor, y_coor):
+    """Tile from MVTLayers or None"""
+    tiles = MVTLayers.objects.filter(
+        layer=layer, zoom=zoom, x_coor=x_coor, y_coor=y_coor
+    ).values_list("tile", flat=True)[:1]
+    if len(tiles) != 0:
+        return bytes(tiles[0])
+    return None
 
-def mvt_geom_simplification(zoom):
-    """Simplification for territory field"""
-    # For WebMercator (3857) X coordinate bounds are ±20037508.3427892 meters
-    # For SRID 4326 X coordinated bounds are ±180 degrees
-    # resolution = (xmax - xmin) or (xmax * 2)
-    # It is 5-10 times faster work with SRID 4326,
-    # We will apply ST_Simplify before ST_Transform
-    resolution = 360
-    # https://postgis.net/docs/ST_AsMVT.html
-    # tile extent in screen space as defined by the specification
-    extent = 4096
-
-    # Find safe tolerance for ST_Simplfy
-    tolerance = (float(resolution) / 2**zoom) / float(extent)
-    # Apply additional simplification for distant zoom levels
-    tolerance_multiplier = 1 if zoom > 5 else 2.2 - 0.2 * zoom
-    simplification = tolerance * tolerance_multiplier
-    return simplification
-
-
-def parse_ints(arr):
-    """keep only integers in array"""
-    res = []
-    for i in arr:
-        try:
-            clean = int(i)
-            res.append(clean)
-        except ValueError:
-            pass
-    return res
+
+def tile_response(tile):
+    """Protobuf response, empty tiles are served with 204"""
+    if tile:
+        return HttpResponse(tile, content_type="application/x-protobuf")
+    return HttpResponse(status=204)
 
 
+@cached_tile("stv", versioned=True)
 def mvt_stv(request, zoom, x_coor, y_coor):
     """
     Custom view to serve Mapbox Vector Tiles for Political Borders.
+    Optional `date` (JDN) keeps only STVs which exist at this date.
     """
     tes = parse_ints(request.GET.getlist("te"))
     stv = parse_ints(request.GET.getlist("stv"))
+    try:
+        date = parse_date(request.GET.get("date"))
+    except ValueError:
+        return JsonResponse({"error": "Use JDN for date"}, status=400)
 
     where = []
     if len(tes) > 0:
         where.append("entity_id=ANY(%(tes)s)")
     if len(stv) > 0:
         where.append("id=ANY(%(stv)s)")
+    if len(where) > 0:
+        where = [" OR ".join(where)]
+
+    if date is not None:
+        where.append(MVT_STV_DATE_FILTER)
 
-    tile = None
     if len(where) > 0:
-        with connection.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT ST_AsMVT(a, 'stv_admin') AS tile
-                FROM ({} AND ({})) AS a
-                """.format(  # nosec
-                    MVT_STV_QUERY, " OR ".join(where)
-                ),
-                {
-                    "zoom": zoom,
-                    "x_coor": x_coor,
-                    "y_coor": y_coor,
-                    "simplification": mvt_geom_simplification(zoom),
-                    "stv": stv,
-                    "tes": tes,
-                },
-            )
-            tile = bytes(cursor.fetchone()[0])
-    else:
-        tiles = MVTLayers.objects.filter(
-            layer="stv", zoom=zoom, x_coor=x_coor, y_coor=y_coor
+        tile = render_stv_tile(
+            "stv_admin" if len(tes) + len(stv) > 0 else "stv",
+            where,
+            stv_mvt_params(
+                zoom,
+                x_coor,
+                y_coor,
+                stv=stv,
+                tes=tes,
+                date_start=date,
+                date_end=date,
+            ),
         )
-        if len(tiles) != 0:
-            tile = bytes(tiles[0].tile)
+    else:
+        tile = pregenerated_tile("stv", zoom, x_coor, y_coor)
+    return tile_response(tile)
 
-    if tile is not None:
-        return HttpResponse(tile, content_type="application/x-protobuf")
-    return HttpResponse(status=204)
+
+@cached_tile("stv", versioned=True)
+def mvt_stv_bucket(request, bucket, zoom, x_coor, y_coor):
+    """
+    Mapbox Vector Tiles for Political Borders within one era bucket.
+    Tiles are pregenerated by `generate_mvt --date-buckets`,
+    missing ones are rendered on demand.
+    """
+    layer, where, dates = stv_mvt_layer(bucket)
+    tile = pregenerated_tile(layer, zoom, x_coor, y_coor)
+    if tile is None:
+        tile = render_stv_tile(
+            "stv", where, stv_mvt_params(zoom, x_coor, y_coor, **dates)
+        )
+    return tile_response(tile)
@@ -0,0 +1,65 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+from json.decoder import JSONDecodeError
+
+from django.http import JsonResponse
+from api.helpers.lookup import stvs_at_points, stvs_at_cached_data
+
+# Maximum number of points looked up in one request
+MAX_POINTS = 1000
+
+
+def _point(lon, lat, date):
+    point = (float(lon), float(lat), float(date))
+    if not (-180 <= point[0] <= 180 and -90 <= point[1] <= 90):
+        raise ValueError
+    return point
+
+
+def stv_at(request):
+    """
+    STVs controlling a location at a date, with parent entities at that date.
+    GET takes `lon`, `lat` and `date` JDN.
+    POST takes JSON body with `points` as list of [lon, lat, date],
+    answered in the same order, or `cached_data` ids, answered by id.
+    """
+    try:
+        if request.method == "GET":
+            point = _point(request.GET["lon"], request.GET["lat"], request.GET["date"])
+            return JsonResponse(stvs_at_points([point])[0], safe=False)
+
+        body = json.loads(request.body)
+        if "cached_data" in body:
+            ids = [int(i) for i in body["cached_data"]]
+            if len(ids) > MAX_POINTS:
+                raise ValueError
+            return JsonResponse(stvs_at_cached_data(ids))
+        points = [_point(*point) for point in body["points"]]
+        if len(points) > MAX_POINTS:
+            raise ValueError
+        return JsonResponse(stvs_at_points(points), safe=False)
+    except (KeyError, TypeError, ValueError, JSONDecodeError):
+        return JsonResponse(
+            {"error": "Use lon, lat and date or up to {} points".format(MAX_POINTS)},
+            status=400,
+        )
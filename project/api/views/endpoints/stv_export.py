@@ -0,0 +1,76 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from django.http import JsonResponse, StreamingHttpResponse
+from api.helpers.export import stv_export_filters, stv_features
+from api.helpers.query_params import parse_date, parse_ints
+
+
+def _parse_bbox(value):
+    """xmin,ymin,xmax,ymax from query string"""
+    if value is None:
+        return None
+    bbox = [float(i) for i in value.split(",")]
+    if len(bbox) != 4:
+        raise ValueError
+    return bbox
+
+
+def _feature_collection(features):
+    yield '{"type": "FeatureCollection", "features": ['
+    separator = ""
+    for feature in features:
+        yield separator + feature
+        separator = ","
+    yield "]}"
+
+
+def stv_export(request):
+    """
+    Stream STVs as GeoJSON FeatureCollection.
+    Filter by `stv` ids, `entity` ids, `start_date`/`end_date` JDN and
+    `bbox` as xmin,ymin,xmax,ymax; the full map is exported without filters.
+    """
+    try:
+        bbox = _parse_bbox(request.GET.get("bbox"))
+    except ValueError:
+        return JsonResponse({"error": "Use xmin,ymin,xmax,ymax for bbox"}, status=400)
+    try:
+        start_date = parse_date(request.GET.get("start_date"))
+        end_date = parse_date(request.GET.get("end_date"))
+    except ValueError:
+        return JsonResponse(
+            {"error": "Use JDN for start_date and end_date"}, status=400
+        )
+
+    where, params = stv_export_filters(
+        ids=parse_ints(request.GET.getlist("stv")),
+        entities=parse_ints(request.GET.getlist("entity")),
+        start_date=start_date,
+        end_date=end_date,
+        bbox=bbox,
+    )
+    response = StreamingHttpResponse(
+        _feature_collection(stv_features(where, params)),
+        content_type="application/json",
+    )
+    response["Content-Disposition"] = "attachment;filename=stvs.json;"
+    return response
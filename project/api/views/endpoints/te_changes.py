@@ -0,0 +1,57 @@
+# pylint: disable=C0302
+
+"""
+Chron.
+Copyright (C) 2020 Alisa Belyaeva, Ata Ali Kilicli, Amaury Martiny,
+Daniil Mordasov, Liam O’Flynn, Mikhail Orlov.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+
+from django.http import HttpResponse, JsonResponse
+from api.helpers.te_list import te_changes_horizon, te_list_changes
+
+
+def te_changes(request):
+    """
+    Territorial Entities changed since `since` sync cursor, in the format of
+    territorial-entities/list, together with deleted entity and STV ids.
+    Returned version is passed as `since` on the next call, the first one
+    comes with X-Sync-Version header of territorial-entities/list.
+    Cursor follows commit order, changes committed late are not skipped.
+    Changes are kept for TE_CHANGES_RETENTION, expired cursors get 410
+    and reload territorial-entities/list.
+    """
+    try:
+        since = int(request.GET["since"])
+    except (KeyError, ValueError):
+        return JsonResponse(
+            {"error": "Provide `since` from X-Sync-Version"}, status=400
+        )
+    if since < te_changes_horizon():
+        return JsonResponse(
+            {"error": "Changes since `since` expired, reload the list"}, status=410
+        )
+
+    entities, deleted_entities, deleted_stvs, version = te_list_changes(since)
+    return HttpResponse(
+        '{{"version": {}, "entities": [{}], "deleted": {}}}'.format(
+            json.dumps(version),
+            ",".join(entities),
+            json.dumps({"entities": deleted_entities, "stvs": deleted_stvs}),
+        ),
+        content_type="application/json",
+    )
@@ -19,44 +19,51 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from django.db import connection
+import gzip
+import re
+
 from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from api.helpers.te_list import te_list_snapshot, te_list_version
+
+ACCEPTS_BROTLI = re.compile(r"\bbr\b")
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+
+# Compressed payloads and sync cursor of the latest served version
+SNAPSHOT = {"latest": (None, None)}
 
 
 def te_list(request):
-    # pylint: disable=R5102
     """
     Custom view to serve list of the Territorial Entities faster
+    Document is maintained per entity and stored compressed with a version,
+    which is used as ETag.
     """
-    with connection.cursor() as cursor:
-        cursor.execute(
-            """
-            SELECT json_agg(row_to_json(foo))::text FROM (
-                SELECT
-                    id, wikidata_id, color_id AS color, admin_level,
-                    dissolution_date, inception_date, label,
-                    (CASE WHEN stvs IS NOT null THEN stvs ELSE '[]'::json END) AS stvs,
-                    (
-                        CASE WHEN stvs IS NOT null THEN json_array_length(stvs) ELSE 0 END
-                    ) AS stv_count
-                    FROM (
-                    SELECT entity, json_agg(row_to_json(foo)) AS stvs FROM (
-                        SELECT
-                            entity_id as entity,
-                            id,
-                            start_date,
-                            end_date,
-                            ST_AsGeoJSON(visual_center)::json AS visual_center,
-                            "references"
-                        FROM api_spacetimevolume
-                        ) as foo
-                    GROUP BY entity
-                ) as stvs
-                FULL OUTER JOIN api_territorialentity ON api_territorialentity.id = entity
-            ) as foo
-            """
-        )
-        data = cursor.fetchone()[0]
-        if data is None:
-            data = "[]"
-        return HttpResponse(data, content_type="application/json")
+    version = te_list_version()
+    response = HttpResponse(content_type="application/json")
+    response["ETag"] = '"te-list-{}"'.format(version)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    conditional = get_conditional_response(
+        request, etag=response["ETag"], response=response
+    )
+    if conditional is not response:
+        return conditional
+
+    latest, payloads = SNAPSHOT["latest"]
+    if latest != version:
+        payloads = te_list_snapshot(version)
+        SNAPSHOT["latest"] = (version, payloads)
+    payload_gzip, payload_brotli, sync_cursor = payloads
+    # Anything missing in the document is returned by territorial-entities/changes
+    response["X-Sync-Version"] = str(sync_cursor)
+
+    accepted = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    if payload_brotli is not None and ACCEPTS_BROTLI.search(accepted):
+        response.content = payload_brotli
+        response["Content-Encoding"] = "br"
+    elif ACCEPTS_GZIP.search(accepted):
+        response.content = payload_gzip
+        response["Content-Encoding"] = "gzip"
+    else:
+        response.content = gzip.decompress(payload_gzip)
+    return response
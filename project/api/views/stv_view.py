@@ -19,75 +19,125 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-import json
-from json.decoder import JSONDecodeError
-from django.contrib.gis.geos import GEOSGeometry, GEOSException
+import time
+from django.contrib.gis.gdal import DataSource
+from django.contrib.gis.geos import (
+    GEOSGeometry,
+    GEOSException,
+    GeometryCollection,
+    Polygon,
+)
 from django.contrib.gis.gdal.error import GDALException
 from django.utils.datastructures import MultiValueDictKeyError
 from django.core.files.uploadedfile import UploadedFile
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db import transaction
 from django.http import JsonResponse
+from django.db.models import Value
 from rest_framework import viewsets
+from rest_framework.exceptions import ParseError
 
-from api.models import SpacetimeVolume
+from api.models import SpacetimeVolume, jdn_range
 from api.serializers import SpacetimeVolumeSerializer
+from api.helpers.geometry import SimplifyPreserveTopology
+from api.helpers.query_params import parse_date, parse_ints
+from api.helpers.staging import stage_territory
 from api.tasks.add_new_stv import add_new_stv
+from .views import SparseFieldsViewSetMixin
 
 
-def _parse_geometry(request):
+def _timed(timings, name, started):
+    """
+    Record milliseconds since started for Server-Timing header
+    """
+    timings[name] = (time.perf_counter() - started) * 1000
+    return time.perf_counter()
+
+
+def _parse_feature_collection(content, timings):
+    """
+    Read all features with GDAL in one pass, reproject them as one collection
+    and merge them with a single cascaded union
+    """
+    started = time.perf_counter()
+    layer = DataSource(content)[0]
+    srid = layer.srs.srid if layer.srs is not None and layer.srs.srid else 4326
+    collection = GeometryCollection(layer.get_geoms(geos=True), srid=srid)
+    if collection.srid != 4326:
+        collection.transform(4326)
+    started = _timed(timings, "parse", started)
+    geom = collection.unary_union
+    _timed(timings, "union", started)
+    return geom
+
+
+def _parse_geometry(request, timings):
     content = request.data["territory"].read().decode("utf-8")
     try:
-        try:
-            # Parse GeoJSON FeatureCollection
-            geom = GEOSGeometry("POINT EMPTY", srid=4326)
-            features = json.loads(content)
-            for feature in features["features"]:
-                feature_geom = feature["geometry"]
-                if "crs" in features:  # Copy SRID data if present
-                    feature_geom["crs"] = features["crs"]
-                tmp_geom = GEOSGeometry(json.dumps(feature_geom))
-                if tmp_geom.srid != geom.srid:
-                    tmp_geom.transform(geom.srid)
-                geom = geom.union(tmp_geom)
-        except (GDALException, KeyError, JSONDecodeError):
-            geom = GEOSGeometry(content)
-    except GDALException:
+        # Only inline GeoJSON is passed to GDAL, never paths or URLs
+        if content.lstrip().startswith("{"):
+            try:
+                return _parse_feature_collection(content, timings)
+            except (GDALException, GEOSException, IndexError):
+                pass
+        geom = GEOSGeometry(content)
+    except (GDALException, ValueError):
         raise ValidationError("Geometry is not recognized")
     return geom
 
 
+# Prepared once, bounds check of every upload reuses it
+EPSG_4326_BOUNDS = Polygon.from_bbox((-180, -90, 180, 90)).prepared
+
+
+def _polygonal_parts(geom):
+    """
+    Polygons of the geometry, nested collections are flattened
+    """
+    if geom.geom_type == "Polygon":
+        yield geom
+    elif geom.geom_type in ("MultiPolygon", "GeometryCollection"):
+        for part in geom:
+            yield from _polygonal_parts(part)
+
+
+def _repair_geometry(geom):
+    """
+    Make polygonal parts valid and merge them with a single cascaded union,
+    parts of other types are dropped
+    """
+    parts = []
+    for part in _polygonal_parts(geom):
+        if part.valid:
+            parts.append(part)
+        else:
+            # MakeValid might split the part or collapse it to lines
+            parts.extend(_polygonal_parts(part.make_valid()))
+    try:
+        return GeometryCollection(parts, srid=geom.srid).unary_union
+    except GEOSException:
+        raise ValidationError("Invalid geometry")
+
+
 def _validate_geometry(geom):
     if geom.srid != 4326:
         try:
             geom.transform(4326)
         except GEOSException:
             raise ValidationError("Geometry SRID must be 4326")
-    if geom.geom_type == "GeometryCollection":
-        # TODO find a better way to convert Geometry Collection to MultiPolygon
-        tmp_geom = GEOSGeometry("POINT EMPTY", srid=4326)
-        for i in geom:
-            try:
-                tmp_geom = tmp_geom.union(i.buffer(0))
-            except GEOSException:
-                raise ValidationError("Invalid geometry")
-        geom = tmp_geom
+    if geom.geom_type == "GeometryCollection" or not geom.valid:
+        geom = _repair_geometry(geom)
     if geom.geom_type not in ["Polygon", "MultiPolygon"]:
         raise ValidationError("Invalid geometry type")
-    if not geom.valid:
-        geom = geom.buffer(0)
-    if not geom.within(
-        GEOSGeometry("POLYGON ((-180 -90, -180 90, 180 90, 180 -90, -180 -90))")
-    ):
+    if not EPSG_4326_BOUNDS.contains(geom):
         raise ValidationError(
             "Not bounded by EPSG:4326 coordinates, check file projection"
         )
     return geom
 
 
-def _stv_form_validate(request):
+def _stv_form_validate(request, timings):
     """
-    Validate form params
+    Validate form params, durations of geometry processing are added to timings
     """
     if not issubclass(type(request.data.get("territory", None)), UploadedFile):
         raise ValidationError("Territory file is missing")
@@ -100,7 +150,10 @@ def _stv_form_validate(request):
     except (ValueError, MultiValueDictKeyError):
         raise ValidationError("Use JDN for start_date and end_date")
 
-    geom = _validate_geometry(_parse_geometry(request))
+    geom = _parse_geometry(request, timings)
+    started = time.perf_counter()
+    geom = _validate_geometry(geom)
+    _timed(timings, "validate", started)
 
     try:
         request.data["visual_center"] = GEOSGeometry(request.data["visual_center"])
@@ -110,7 +163,17 @@ def _stv_form_validate(request):
     return geom, start_date, end_date
 
 
-class SpacetimeVolumeViewSet(viewsets.ModelViewSet):
+def _query_date(params, name):
+    """
+    JDN from query string, None if not provided
+    """
+    try:
+        return parse_date(params.get(name))
+    except ValueError:
+        raise ParseError("Use JDN for {}".format(name))
+
+
+class SpacetimeVolumeViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for SpacetimeVolumes
     """
@@ -123,10 +186,46 @@ class SpacetimeVolumeViewSet(viewsets.ModelViewSet):
     )
     serializer_class = SpacetimeVolumeSerializer
 
-    @transaction.atomic
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        # Dates should be provided in JDN format
+        date = _query_date(params, "date")
+        start_date = _query_date(params, "start_date")
+        end_date = _query_date(params, "end_date")
+        entities = parse_ints(params.getlist("entity"))
+        admin_level = parse_ints(params.getlist("admin_level"))
+        if date is not None:
+            queryset = queryset.filter(during__contains=date)
+        if start_date is not None or end_date is not None:
+            queryset = queryset.filter(during__overlap=jdn_range(start_date, end_date))
+        if entities:
+            queryset = queryset.filter(entity__in=entities)
+        if admin_level:
+            queryset = queryset.filter(entity__admin_level__in=admin_level)
+        if "bbox" in params:
+            try:
+                bbox = Polygon.from_bbox([float(i) for i in params["bbox"].split(",")])
+            except (TypeError, ValueError):
+                raise ParseError("Use xmin,ymin,xmax,ymax for bbox")
+            bbox.srid = 4326
+            queryset = queryset.filter(territory__intersects=bbox)
+        if "simplify" in params:
+            try:
+                tolerance = float(params["simplify"])
+            except ValueError:
+                raise ParseError("Use simplification tolerance in degrees")
+            queryset = queryset.defer("territory").annotate(
+                simplified_territory=SimplifyPreserveTopology(
+                    "territory", Value(tolerance)
+                )
+            )
+        return queryset
+
     def create(self, request, *args, **kwargs):
         """
         Solve overlaps if included in request body
+        Not atomic, staged territory must be committed before the task runs.
         """
 
         # Validate other data before overlaps
@@ -135,10 +234,13 @@ class SpacetimeVolumeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=empty_territory_data)
         serializer.is_valid(raise_exception=True)
 
-        geom, start_date, end_date = _stv_form_validate(request)
+        timings = {}
+        geom, start_date, end_date = _stv_form_validate(request, timings)
+        staged, checksum = stage_territory(geom)
 
         task = add_new_stv.delay(
-            geom=geom.ewkt,
+            staged=staged,
+            checksum=checksum,
             overlaps_are_missing="overlaps" not in request.data,
             start_date=start_date,
             end_date=end_date,
@@ -147,9 +249,13 @@ class SpacetimeVolumeViewSet(viewsets.ModelViewSet):
             references=request.POST.getlist("references"),
             overlaps=request.POST.getlist("overlaps"),
         )
-        return JsonResponse(
+        response = JsonResponse(
             {"task_status": task.status, "task_id": task.id}, status=201
         )
+        response["Server-Timing"] = ", ".join(
+            "{};dur={:.1f}".format(name, duration) for name, duration in timings.items()
+        )
+        return response
 
     def update(self, request, *args, **kwargs):
         """
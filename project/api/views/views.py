@@ -17,7 +17,7 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from django.db.models import Count
+from django.db.models import Count, Prefetch
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
@@ -33,6 +33,7 @@ from api.models import (
     Narration,
     NarrativeVote,
     Profile,
+    SpacetimeVolume,
     Symbol,
     SymbolFeature,
 )
@@ -43,6 +44,8 @@ from api.serializers import (
     CachedDataSerializer,
     CitySerializer,
     NarrativeSerializer,
+    annotate_narratives,
+    requested_fields,
     MapSettingsSerializer,
     NarrationSerializer,
     NarrativeVoteSerializer,
@@ -53,7 +56,30 @@ from api.serializers import (
 from api.permissions import IsUserOrReadOnly
 
 
-class MapColorSchemeViewSet(viewsets.ModelViewSet):
+class SparseFieldsViewSetMixin:
+    """
+    Defers loading of model fields omitted with ?fields=
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields = requested_fields(self.request)
+        if fields is None:
+            return queryset
+        # Fields used by pagination cursor and joins are always loaded
+        fields |= {name.lstrip("-") for name in queryset.query.order_by}
+        if isinstance(queryset.query.select_related, dict):
+            fields |= set(queryset.query.select_related)
+        return queryset.defer(
+            *[
+                field.name
+                for field in queryset.model._meta.concrete_fields
+                if not field.primary_key and field.name not in fields
+            ]
+        )
+
+
+class MapColorSchemeViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for MapColorScheme
     """
@@ -62,18 +88,31 @@ class MapColorSchemeViewSet(viewsets.ModelViewSet):
     serializer_class = MapColorSchemeSerializer
 
 
-class TerritorialEntityViewSet(viewsets.ModelViewSet):
+class TerritorialEntityViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for TerritorialEntities
     """
 
     queryset = (
-        TerritorialEntity.objects.all().annotate(stv_count=Count("stvs")).order_by("id")
+        TerritorialEntity.objects.all()
+        .annotate(stv_count=Count("stvs"))
+        .prefetch_related(
+            # Territory isn't serialized, don't read it from disk
+            Prefetch(
+                "stvs",
+                queryset=SpacetimeVolume.objects.defer("territory").prefetch_related(
+                    Prefetch("related_events", queryset=CachedData.objects.only("id"))
+                ),
+            ),
+            Prefetch("predecessor", queryset=TerritorialEntity.objects.only("id")),
+            Prefetch("relations", queryset=TerritorialEntity.objects.only("id")),
+        )
+        .order_by("id")
     )
     serializer_class = TerritorialEntitySerializer
 
 
-class PoliticalRelationViewSet(viewsets.ModelViewSet):
+class PoliticalRelationViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for PoliticalRelations
     """
@@ -82,7 +121,7 @@ class PoliticalRelationViewSet(viewsets.ModelViewSet):
     serializer_class = PoliticalRelationSerializer
 
 
-class CachedDataViewSet(viewsets.ModelViewSet):
+class CachedDataViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for CachedData
     """
@@ -107,7 +146,7 @@ class CachedDataViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class CityViewSet(viewsets.ModelViewSet):
+class CityViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     Viewset for Cities
     """
@@ -116,7 +155,7 @@ class CityViewSet(viewsets.ModelViewSet):
     serializer_class = CitySerializer
 
 
-class NarrativeVoteViewSet(viewsets.ModelViewSet):
+class NarrativeVoteViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     Viewset for NarrativeVote model
     """
@@ -140,16 +179,16 @@ class NarrativeVoteViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 
-class NarrativeViewSet(viewsets.ModelViewSet):
+class NarrativeViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Narratives
     """
 
-    queryset = Narrative.objects.all()
+    queryset = annotate_narratives(Narrative.objects.all()).order_by("id")
     serializer_class = NarrativeSerializer
 
 
-class MapSettingsViewSet(viewsets.ModelViewSet):
+class MapSettingsViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for MapSettings
     """
@@ -165,7 +204,7 @@ class MapSettingsViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class NarrationViewSet(viewsets.ModelViewSet):
+class NarrationViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Narrations
     """
@@ -197,7 +236,7 @@ class SymbolFeatureViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class SymbolViewSet(viewsets.ModelViewSet):
+class SymbolViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Symbols
     """
@@ -206,7 +245,7 @@ class SymbolViewSet(viewsets.ModelViewSet):
     serializer_class = SymbolSerializer
 
 
-class ProfileViewSet(viewsets.ModelViewSet):
+class ProfileViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Profile
     """
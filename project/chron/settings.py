@@ -177,6 +177,23 @@ CACHEOPS_REDIS = "redis://redis:6379/0"
 CACHEOPS_DEFAULTS = {"timeout": 60 * 60 * 24}
 CACHEOPS = {"api.*": {"ops": "all"}}
 
+# Vector tiles
+
+# Deepest zoom level of TileLayout and pregenerated tiles
+MVT_LAYOUT_ZOOM = int(os.environ.get("ZOOM", 8))
+
+# Deepest zoom level with precomputed simplified STV territory
+MVT_SIMPLIFIED_ZOOM = int(os.environ.get("MVT_SIMPLIFIED_ZOOM", MVT_LAYOUT_ZOOM))
+
+# Length of the era bucket for date-aware STV tiles, in days (~10 years)
+MVT_STV_DATE_BUCKET = int(os.environ.get("MVT_STV_DATE_BUCKET", 3653))
+
+# Rendered tiles are kept in-process (LRU bounded by size) and in Redis
+MVT_CACHE_ENABLED = not DEBUG
+MVT_CACHE_ALIAS = "default"
+MVT_CACHE_MAX_BYTES = int(os.environ.get("MVT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+MVT_CACHE_TIMEOUT = 60 * 10
+
 # DB Settings
 
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
@@ -198,6 +215,7 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "drf_firebase_auth.authentication.FirebaseAuthentication"
     ],
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.CursorPagination",
 }
 
 # Firebase
@@ -46,6 +46,14 @@ def setup_periodic_tasks(sender, **kwargs):
             crontab(hour=i, minute=0),
             call_command.s(cmd),
         )
+    # Uploads of add_new_stv tasks which never ran
+    sender.add_periodic_task(
+        crontab(minute=30), call_command.s("clean_staged_territories")
+    )
+    # Expired territorial-entities/changes log
+    sender.add_periodic_task(
+        crontab(hour=4, minute=0), call_command.s("clean_te_changes")
+    )
 
 
 @APP.task